@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: actor_learner.py
+@time: 17/6/2025 下午 3:10
+@functions：actor-learner 解耦训练，多个采集进程并行运行 WirelessCommEnv，学习进程持续做梯度更新
+
+结构：
+    采集进程 × N - 各自运行一个 WirelessCommEnv 和一份 Actor 副本，每 sync_every 步从共享内存拉取最新权重，
+                   经验写入自己的单生产者单消费者无锁队列（共享内存环形缓冲区）
+    学习进程     - 主进程，不断把各队列中的经验批量写入回放缓冲区并调用 agent.update()，
+                   每 publish_every 次更新把 actor 权重发布到共享内存
+
+用法：
+    python actor_learner.py --collectors 4 --updates 20000
+"""
+import argparse
+import multiprocessing as mp
+import queue
+import time
+
+import numpy as np
+import torch
+
+from ddpg_agent import Actor, DDPGAgent
+from rng import spawn_seeds
+from wireless_env import WirelessCommEnv
+
+
+class TransitionQueue:
+    """
+    单生产者单消费者的无锁环形队列
+
+    经验按行存放在共享内存中，每行依次为 state, action, reward, next_state, done。
+    head 为累计写入行数，只由生产者修改；tail 为累计读取行数，只由消费者修改。
+    生产者先写行数据再增加 head，消费者读完数据再增加 tail，因此不需要加锁
+    （依赖 x86 等平台上对齐的 8 字节写入不会被拆分、写入不会被重排到前面的写入之前）。
+    """
+
+    def __init__(self, capacity, state_dim, action_dim, ctx=None):
+        ctx = ctx or mp.get_context()
+        self.capacity = capacity
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.row_size = 2 * state_dim + action_dim + 2
+        self._raw = ctx.RawArray('f', capacity * self.row_size)
+        self._raw_counters = ctx.RawArray('q', 2)  # [head, tail]
+        self._attach()
+
+    def _attach(self):
+        self._rows = np.frombuffer(self._raw, dtype=np.float32).reshape(self.capacity, self.row_size)
+        self._counters = np.frombuffer(self._raw_counters, dtype=np.int64)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_rows'], state['_counters']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+
+    @property
+    def head(self):
+        return int(self._counters[0])
+
+    def __len__(self):
+        return int(self._counters[0] - self._counters[1])
+
+    def put(self, state, action, reward, next_state, done):
+        """生产者写入一条经验，队列已满时返回 False"""
+        head = int(self._counters[0])
+        if head - int(self._counters[1]) >= self.capacity:
+            return False
+        s, a = self.state_dim, self.action_dim
+        row = self._rows[head % self.capacity]
+        row[:s] = state
+        row[s:s + a] = action
+        row[s + a] = reward
+        row[s + a + 1:2 * s + a + 1] = next_state
+        row[-1] = done
+        self._counters[0] = head + 1
+        return True
+
+    def get(self, max_rows=None):
+        """
+        消费者取出当前可读的全部经验（最多 max_rows 行）
+
+        返回：
+            (states, actions, rewards, next_states, dones) 的拷贝，队列为空时返回 None
+        """
+        tail = int(self._counters[1])
+        count = int(self._counters[0]) - tail
+        if max_rows is not None:
+            count = min(count, max_rows)
+        if count <= 0:
+            return None
+        rows = self._rows[(tail + np.arange(count)) % self.capacity]
+        self._counters[1] = tail + count
+        s, a = self.state_dim, self.action_dim
+        return rows[:, :s], rows[:, s:s + a], rows[:, s + a], rows[:, s + a + 1:2 * s + a + 1], rows[:, -1]
+
+
+class SharedWeights:
+    """
+    共享内存中的扁平化模型权重，用版本号实现无锁发布（seqlock）
+
+    发布方写入前把版本号加到奇数、写完再加到偶数；读取方只接受前后两次读到同一偶数版本的拷贝。
+    """
+
+    def __init__(self, module, ctx=None):
+        ctx = ctx or mp.get_context()
+        self.numel = sum(p.numel() for p in module.parameters())
+        self._raw = ctx.RawArray('f', self.numel)
+        self._raw_version = ctx.RawArray('q', 1)
+        self._attach()
+        self.publish(module)
+
+    def _attach(self):
+        self._flat = np.frombuffer(self._raw, dtype=np.float32)
+        self._version = np.frombuffer(self._raw_version, dtype=np.int64)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_flat'], state['_version']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+
+    @property
+    def version(self):
+        return int(self._version[0])
+
+    def publish(self, module):
+        self._version[0] += 1
+        with torch.no_grad():
+            self._flat[:] = torch.nn.utils.parameters_to_vector(module.parameters()).cpu().numpy()
+        self._version[0] += 1
+
+    def pull(self, module, last_version=-1):
+        """版本比 last_version 新时把权重拷贝到 module，返回 module 当前对应的版本"""
+        version = self.version
+        if version == last_version or version % 2:
+            return last_version  # 没有更新或正在发布，下次再取
+        flat = self._flat.copy()
+        if self.version != version:
+            return last_version
+        with torch.no_grad():
+            torch.nn.utils.vector_to_parameters(torch.from_numpy(flat), module.parameters())
+        return version
+
+
+def _collector(worker_id, transitions, weights, stop, episodes, seed, num_users, max_steps, noise_scale,
+               sync_every):
+    """采集进程：用最新同步的 actor 与环境交互，经验写入 transitions"""
+    torch.set_num_threads(1)
+    env_seed, noise_seed = spawn_seeds(seed, 2)
+    env = WirelessCommEnv(num_users=num_users, seed=env_seed)
+    rng = np.random.default_rng(noise_seed)
+    actor = Actor(env.observation_space.shape[0], env.action_space.shape[0])
+    version = weights.pull(actor)
+    steps = 0
+    try:
+        while not stop.is_set():
+            state, _ = env.reset()
+            total_reward = 0.0
+            for _ in range(max_steps):
+                if steps % sync_every == 0:
+                    version = weights.pull(actor, version)
+                with torch.no_grad():
+                    action = actor(torch.from_numpy(state.astype(np.float32)).unsqueeze(0)).numpy()[0]
+                action = np.clip(action + noise_scale * rng.standard_normal(action.shape), 0, 1)
+                next_state, reward, terminated, truncated, _ = env.step(action)
+                while not transitions.put(state, action, reward, next_state, terminated):
+                    if stop.is_set():
+                        return
+                    time.sleep(1e-4)  # 队列已满：等学习进程消费
+                steps += 1
+                total_reward += reward
+                state = next_state
+                if terminated or truncated:
+                    break
+            episodes.put((worker_id, total_reward))
+    except KeyboardInterrupt:
+        pass
+
+
+class ActorLearner:
+    """
+    actor-learner 训练器
+
+    参数：
+        agent : DDPGAgent，学习进程使用其网络、优化器和回放缓冲区
+        num_collectors : 采集进程数
+        queue_capacity : 每个采集进程的队列容量（行）
+        sync_every : 采集进程每隔多少个环境步拉取一次权重
+        publish_every : 学习进程每隔多少次更新发布一次权重
+    """
+
+    def __init__(self, agent, num_collectors=4, num_users=10, max_steps=200, noise_scale=0.1,
+                 queue_capacity=4096, sync_every=50, publish_every=10, context=None, seed=None):
+        self.agent = agent
+        self.num_collectors = num_collectors
+        self.publish_every = publish_every
+        ctx = mp.get_context(context)
+
+        probe = WirelessCommEnv(num_users=num_users)
+        state_dim, action_dim = probe.observation_space.shape[0], probe.action_space.shape[0]
+        self.queues = [TransitionQueue(queue_capacity, state_dim, action_dim, ctx) for _ in range(num_collectors)]
+        self.weights = SharedWeights(agent.actor, ctx)
+        self.stop = ctx.Event()
+        self.episodes = ctx.Queue()  # 每局结束时的 (worker_id, 总奖励)，低频，用普通队列即可
+
+        self.processes = []
+        for worker_id, worker_seed in enumerate(spawn_seeds(seed, num_collectors)):
+            process = ctx.Process(
+                target=_collector,
+                args=(worker_id, self.queues[worker_id], self.weights, self.stop, self.episodes, worker_seed,
+                      num_users, max_steps, noise_scale, sync_every),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+
+        self.env_steps = 0
+        self.updates = 0
+        self.episode_rewards = []
+
+    def drain(self):
+        """把所有队列中的经验写入回放缓冲区，返回写入条数"""
+        count = 0
+        for transitions in self.queues:
+            batch = transitions.get()
+            if batch is not None:
+                self.agent.save_experience_batch(*batch)
+                count += len(batch[2])
+        self.env_steps += count
+        while True:
+            try:
+                self.episode_rewards.append(self.episodes.get_nowait()[1])
+            except queue.Empty:
+                break
+        return count
+
+    def run(self, num_updates, report_every=5.0, warmup=None):
+        """
+        持续训练直到完成 num_updates 次更新
+
+        参数：
+            report_every : 每隔多少秒打印一次吞吐量
+            warmup : 回放缓冲区达到该条数后才开始更新，默认 agent.batch_size
+        返回：
+            {'env_steps', 'updates', 'seconds', 'env_steps_per_sec', 'updates_per_sec'}
+        """
+        warmup = warmup or self.agent.batch_size
+        start = last_report = time.perf_counter()
+        steps_at_report, updates_at_report = self.env_steps, self.updates
+        target = self.updates + num_updates
+        while self.updates < target:
+            self.drain()
+            if len(self.agent.replay_buffer) < warmup:
+                time.sleep(1e-3)
+                continue
+            self.agent.update()
+            self.updates += 1
+            if self.updates % self.publish_every == 0:
+                self.weights.publish(self.agent.actor)
+
+            now = time.perf_counter()
+            if report_every and now - last_report >= report_every:
+                interval = now - last_report
+                recent = np.mean(self.episode_rewards[-10:]) if self.episode_rewards else float('nan')
+                print(f"env-steps/s: {(self.env_steps - steps_at_report) / interval:8.0f} | "
+                      f"updates/s: {(self.updates - updates_at_report) / interval:7.1f} | "
+                      f"episodes: {len(self.episode_rewards)} | recent reward: {recent:.2f}")
+                last_report, steps_at_report, updates_at_report = now, self.env_steps, self.updates
+        self.drain()
+        seconds = time.perf_counter() - start
+        return {
+            'env_steps': self.env_steps,
+            'updates': self.updates,
+            'seconds': seconds,
+            'env_steps_per_sec': self.env_steps / seconds,
+            'updates_per_sec': self.updates / seconds,
+        }
+
+    def close(self):
+        self.stop.set()
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+
+    def __del__(self):
+        if getattr(self, 'processes', None):
+            self.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='actor-learner 并行训练')
+    parser.add_argument('--collectors', type=int, default=4, help='采集进程数')
+    parser.add_argument('--updates', type=int, default=20000, help='梯度更新次数')
+    parser.add_argument('--num_users', type=int, default=10, help='用户数')
+    parser.add_argument('--max_steps', type=int, default=200, help='每局最大步数')
+    parser.add_argument('--noise', type=float, default=0.1, help='探索噪声标准差')
+    parser.add_argument('--sync_every', type=int, default=50, help='采集进程拉取权重的间隔（环境步）')
+    parser.add_argument('--publish_every', type=int, default=10, help='发布权重的间隔（更新次数）')
+    parser.add_argument('--prioritized', action='store_true', help='优先经验回放')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子')
+    return parser.parse_args()
+
+
+def main(args):
+    probe = WirelessCommEnv(num_users=args.num_users)
+    agent = DDPGAgent(probe.observation_space.shape[0], probe.action_space.shape[0], prioritized=args.prioritized)
+    trainer = ActorLearner(agent, num_collectors=args.collectors, num_users=args.num_users,
+                           max_steps=args.max_steps, noise_scale=args.noise, sync_every=args.sync_every,
+                           publish_every=args.publish_every, seed=args.seed)
+    try:
+        stats = trainer.run(args.updates)
+    finally:
+        trainer.close()
+    print(f"共 {stats['env_steps']} 个环境步、{stats['updates']} 次更新，用时 {stats['seconds']:.1f}s | "
+          f"env-steps/s: {stats['env_steps_per_sec']:.0f} | updates/s: {stats['updates_per_sec']:.1f}")
+
+    torch.save(agent.actor.state_dict(), "ddpg_actor.pth")
+    torch.save(agent.critic.state_dict(), "ddpg_critic.pth")
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: agent_loader.py
+@time: 24/6/2025 上午 9:30
+@functions：按变体加载 ddpg_agent 模块（上级目录与 test/ 目录下的模块同名，不能直接 import），供基准测试与导出工具共用
+"""
+import importlib.util
+import os
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+_AGENT_FILES = {
+    'root': os.path.join(_BASE_DIR, 'ddpg_agent.py'),
+    'test': os.path.join(_BASE_DIR, 'test', 'ddpg_agent.py'),
+}
+
+
+def load_agent_module(variant='root'):
+    """按文件路径加载指定变体的 ddpg_agent 模块（两个目录下模块同名）"""
+    spec = importlib.util.spec_from_file_location(f'ddpg_agent_{variant}', _AGENT_FILES[variant])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: bench_env.py
+@time: 13/6/2025 上午 10:20
+@functions：环境 step / reset 微基准测试，结果输出为 JSON，并可与基线比较发现性能回退
+
+用法：
+    python bench_env.py --output bench_baseline.json               # 生成基线
+    python bench_env.py --baseline bench_baseline.json --tolerance 0.15   # 与基线比较，回退时退出码为1
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from env_pool import SubprocVectorEnv, load_env_module, make_env
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='环境微基准测试')
+    parser.add_argument('--variant', type=str, default='both', choices=['root', 'test', 'both'],
+                        help='测试的环境变体')
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 50, 200, 1000], help='用户数列表')
+    parser.add_argument('--cases', type=str, nargs='+', default=['step', 'vector_step', 'reset'],
+                        choices=list(CASES), help='测试项（pool_step 测试进程池通信开销，需显式指定）')
+    parser.add_argument('--num_envs', type=int, default=16, help='向量化测试中的环境数')
+    parser.add_argument('--iters', type=int, default=200, help='每次计时的调用次数')
+    parser.add_argument('--repeats', type=int, default=5, help='重复计时次数（取中位数）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--output', type=str, default=None, help='结果 JSON 路径')
+    parser.add_argument('--baseline', type=str, default=None, help='基线 JSON 路径')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='允许的相对变慢比例，超过即判定为回退')
+    return parser.parse_args()
+
+
+def timeit(fn, iters, repeats):
+    """先预热一次，再重复 repeats 次、每次调用 fn iters 次，返回每次调用的耗时（纳秒）列表"""
+    fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        for _ in range(iters):
+            fn()
+        samples.append((time.perf_counter_ns() - start) / iters)
+    return samples
+
+
+def random_action(action_dim, rng):
+    return rng.uniform(0, 1, action_dim).astype(np.float32)
+
+
+def bench_step(variant, num_users, args):
+    rng = np.random.default_rng(args.seed)
+    env = make_env(variant, num_users=num_users, seed=args.seed, **env_kwargs(variant, num_users))
+    env.reset()
+    action = random_action(env.action_space.shape[0], rng)
+    return timeit(lambda: env.step(action), args.iters, args.repeats), 1
+
+
+def bench_reset(variant, num_users, args):
+    env = make_env(variant, num_users=num_users, seed=args.seed, **env_kwargs(variant, num_users))
+    return timeit(env.reset, args.iters, args.repeats), 1
+
+
+def bench_vector_step(variant, num_users, args):
+    """进程内批量 step，目前只有 root 变体有 VectorWirelessCommEnv（其他变体返回 None 表示跳过）"""
+    if variant != 'root':
+        return None
+    rng = np.random.default_rng(args.seed)
+    env = load_env_module('root').VectorWirelessCommEnv(num_envs=args.num_envs, num_users=num_users,
+                                                        seed=args.seed)
+    env.reset()
+    actions = rng.uniform(0, 1, (args.num_envs, env.single_action_space.shape[0])).astype(np.float32)
+    return timeit(lambda: env.step(actions), args.iters, args.repeats), args.num_envs
+
+
+def bench_pool_step(variant, num_users, args):
+    """单进程 SubprocVectorEnv 的 step，主要反映管道和共享内存的通信开销，而不是批量计算"""
+    rng = np.random.default_rng(args.seed)
+    env_fns = [functools.partial(make_env, variant, num_users=num_users, **env_kwargs(variant, num_users))
+               ] * args.num_envs
+    env = SubprocVectorEnv(env_fns, num_workers=1, seed=args.seed)
+    try:
+        env.reset()
+        actions = rng.uniform(0, 1, (args.num_envs, env.single_action_space.shape[0])).astype(np.float32)
+        samples = timeit(lambda: env.step(actions), args.iters, args.repeats)
+    finally:
+        env.close()
+    return samples, args.num_envs
+
+
+def env_kwargs(variant, num_users):
+    """test 变体按 max_users 填充观测，max_users 取为测试的用户数"""
+    return {'max_users': max(num_users, 10)} if variant == 'test' else {}
+
+
+CASES = {
+    'step': bench_step,
+    'vector_step': bench_vector_step,
+    'pool_step': bench_pool_step,
+    'reset': bench_reset,
+}
+
+
+def run(args):
+    variants = ['root', 'test'] if args.variant == 'both' else [args.variant]
+    results = {}
+    for variant in variants:
+        for num_users in args.users:
+            for case in args.cases:
+                result = CASES[case](variant, num_users, args)
+                if result is None:
+                    continue  # 该变体不支持此测试项
+                samples, batch = result
+                ns_per_call = float(np.median(samples))
+                key = f"{variant}/{case}/users={num_users}"
+                results[key] = {
+                    'variant': variant,
+                    'case': case,
+                    'num_users': num_users,
+                    'batch': batch,
+                    'ns_per_call': ns_per_call,
+                    'ns_per_env_step': ns_per_call / batch,
+                    'calls_per_sec': 1e9 / ns_per_call,
+                    'env_steps_per_sec': batch * 1e9 / ns_per_call,
+                    'samples_ns': samples,
+                }
+                print(f"{key:<32} {ns_per_call / 1e3:>10.1f} us/call {batch * 1e9 / ns_per_call:>12.0f} env-steps/s")
+    return results
+
+
+def metadata(args):
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'iters': args.iters,
+        'repeats': args.repeats,
+        'num_envs': args.num_envs,
+        'seed': args.seed,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    与基线逐项比较 ns_per_call
+
+    返回：
+        回退项的 key 列表（耗时超过基线的 1 + tolerance 倍）
+    """
+    regressions = []
+    print(f"\n{'benchmark':<32} {'baseline us':>12} {'current us':>12} {'ratio':>7}")
+    for key, current in results.items():
+        if key not in baseline:
+            print(f"{key:<32} {'-':>12} {current['ns_per_call'] / 1e3:>12.1f} {'new':>7}")
+            continue
+        base = baseline[key]['ns_per_call']
+        ratio = current['ns_per_call'] / base
+        status = ''
+        if ratio > 1 + tolerance:
+            status = 'REGRESSION'
+            regressions.append(key)
+        elif ratio < 1 - tolerance:
+            status = 'faster'
+        print(f"{key:<32} {base / 1e3:>12.1f} {current['ns_per_call'] / 1e3:>12.1f} {ratio:>6.2f}x {status}")
+    return regressions
+
+
+def main(args):
+    print(f"iters={args.iters} | repeats={args.repeats} | num_envs={args.num_envs} | cpu_count={os.cpu_count()}")
+    results = run(args)
+    report = {'meta': metadata(args), 'results': results}
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.tolerance)
+        report['baseline'] = {'path': args.baseline, 'tolerance': args.tolerance, 'regressions': regressions}
+        if regressions:
+            print(f"\n{len(regressions)} 项超过容差 {args.tolerance:.0%}: {', '.join(regressions)}")
+            exit_code = 1
+        else:
+            print(f"\n全部在容差 {args.tolerance:.0%} 以内")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"结果已写入 {args.output}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
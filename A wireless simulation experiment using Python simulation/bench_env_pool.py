@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: bench_env_pool.py
+@time: 3/6/2025 下午 9:30
+@functions：测试 SubprocVectorEnv 从 1 个进程到全部核心的 steps/sec 扩展性
+"""
+import argparse
+import functools
+import os
+import time
+
+import numpy as np
+
+from env_pool import SubprocVectorEnv, make_env
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='环境进程池扩展性测试')
+    parser.add_argument('--variant', type=str, default='both', choices=['root', 'test', 'both'],
+                        help='测试的环境变体')
+    parser.add_argument('--num_envs', type=int, default=64, help='环境总数')
+    parser.add_argument('--num_users', type=int, default=10, help='每个环境的用户数')
+    parser.add_argument('--iters', type=int, default=200, help='每个配置的 step 次数')
+    parser.add_argument('--asynchronous', action='store_true', help='使用异步模式')
+    parser.add_argument('--max_workers', type=int, default=os.cpu_count(), help='最大进程数')
+    return parser.parse_args()
+
+
+def worker_counts(max_workers):
+    """1, 2, 4, ... 直到 max_workers（总包含 max_workers 本身）"""
+    counts, n = [], 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def bench(variant, num_workers, args):
+    env_fns = [functools.partial(make_env, variant, num_users=args.num_users)] * args.num_envs
+    pool = SubprocVectorEnv(env_fns, num_workers=num_workers, asynchronous=args.asynchronous)
+    act_dim = pool.single_action_space.shape[0]
+    pool.reset()
+
+    actions = np.random.uniform(0, 1, (args.num_envs, act_dim)).astype(np.float32)
+    env_ids = None
+    steps = 0
+    start = time.perf_counter()
+    for _ in range(args.iters):
+        batch = actions if env_ids is None else actions[env_ids]
+        _, rewards, _, _, info = pool.step(batch, env_ids)
+        env_ids = info['env_id'] if args.asynchronous else None
+        steps += len(rewards)
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return steps / elapsed
+
+
+def main(args):
+    variants = ['root', 'test'] if args.variant == 'both' else [args.variant]
+    print(f"num_envs={args.num_envs} | num_users={args.num_users} | "
+          f"{'async' if args.asynchronous else 'sync'} | cpu_count={os.cpu_count()}")
+    for variant in variants:
+        print(f"\n=== {variant} ===")
+        print(f"{'workers':>8} {'steps/sec':>12} {'speedup':>8}")
+        base = None
+        for n in worker_counts(min(args.max_workers, args.num_envs)):
+            rate = bench(variant, n, args)
+            base = base or rate
+            print(f"{n:>8} {rate:>12.0f} {rate / base:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: bench_update.py
+@time: 18/6/2025 下午 4:30
+@functions：DDPGAgent.update() 延迟基准测试，对比逐参数循环与 foreach 融合的目标网络软更新、
+            critic 输入拼接与首层拆分、默认执行与 CPU 执行配置（按批量选线程数 / bfloat16 autocast）
+
+用法：
+    python bench_update.py                                  # 两个 agent 变体，loop / foreach 两种软更新
+    python bench_update.py --variant test --users 50 --output bench_update.json
+    python bench_update.py --soft_update foreach --critic_input cat split --profile none threads bf16 \
+        --batch_sizes 64 128 1024
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+from agent_loader import load_agent_module
+from cpu_profile import CPUProfile
+
+
+def loop_soft_update(agent):
+    """改动前的软更新：逐参数 copy_(tau * p + (1 - tau) * tp)，每个张量产生两个临时张量"""
+    for param, target_param in zip(agent._online_params, agent._target_params):
+        target_param.data.copy_(agent.tau * param.data + (1 - agent.tau) * target_param.data)
+
+
+SOFT_UPDATES = {
+    'loop': loop_soft_update,
+    'foreach': None,  # agent 自带的 soft_update
+}
+
+
+class _ConcatInput(nn.Module):
+    """改动前的 critic 首层：先 torch.cat([state, action]) 再过一个 Linear"""
+
+    def __init__(self, split):
+        super(_ConcatInput, self).__init__()
+        self.linear = nn.Linear(split.state_weight.shape[1] + split.action_weight.shape[1], split.bias.shape[0])
+        with torch.no_grad():
+            self.linear.weight.copy_(torch.cat([split.state_weight, split.action_weight], 1))
+            self.linear.bias.copy_(split.bias)
+
+    def forward(self, inputs):
+        return self.linear(torch.cat(inputs, 1))
+
+
+def concat_critic_input(agent):
+    """把 critic 与目标 critic 的首层换回拼接输入，重建优化器与软更新参数列表"""
+    target_name = 'critic_target' if hasattr(agent, 'critic_target') else 'target_critic'
+    for critic in (agent.critic, getattr(agent, target_name)):
+        critic.net[0] = _ConcatInput(critic.net[0])
+    lr = agent.critic_optimizer.param_groups[0]['lr']
+    agent.critic_optimizer = optim.Adam(agent.critic.parameters(), lr=lr)
+    actor_target = agent.actor_target if hasattr(agent, 'actor_target') else agent.target_actor
+    agent._online_params = list(agent.actor.parameters()) + list(agent.critic.parameters())
+    agent._target_params = list(actor_target.parameters()) + list(getattr(agent, target_name).parameters())
+
+
+CRITIC_INPUTS = {
+    'split': None,  # agent 自带的 StateActionLinear
+    'cat': concat_critic_input,
+}
+PROFILES = {
+    'none': lambda: None,
+    'threads': lambda: CPUProfile(),
+    'bf16': lambda: CPUProfile(bf16=True),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='DDPGAgent.update() 延迟基准测试')
+    parser.add_argument('--variant', type=str, default='both', choices=['root', 'test', 'both'],
+                        help='测试的 agent 变体')
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 50], help='用户数列表（决定网络输入维度）')
+    parser.add_argument('--soft_update', type=str, nargs='+', default=list(SOFT_UPDATES),
+                        choices=list(SOFT_UPDATES), help='软更新实现')
+    parser.add_argument('--critic_input', type=str, nargs='+', default=['split'], choices=list(CRITIC_INPUTS),
+                        help='critic 首层：split 为预拆分权重，cat 为改动前的输入拼接')
+    parser.add_argument('--profile', type=str, nargs='+', default=['none'], choices=list(PROFILES),
+                        help='CPU 执行配置：none 默认，threads 按批量选线程数，bf16 再加 bfloat16 autocast')
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=None, help='批量大小列表（默认使用 agent 的设置）')
+    parser.add_argument('--iters', type=int, default=100, help='每次计时的 update 次数')
+    parser.add_argument('--repeats', type=int, default=5, help='重复计时次数（取中位数）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--output', type=str, default=None, help='结果 JSON 路径')
+    return parser.parse_args()
+
+
+def make_agent(variant, num_users, seed, cpu_profile=None, batch_size=None):
+    torch.manual_seed(seed)
+    module = load_agent_module(variant)
+    state_dim, action_dim = 4 * num_users, 2 * num_users
+    agent = module.DDPGAgent(state_dim, action_dim, cpu_profile=cpu_profile)
+    agent.batch_size = batch_size or agent.batch_size
+    rng = np.random.default_rng(seed)
+    count = 16 * agent.batch_size
+    agent.replay_buffer.push_batch(rng.random((count, state_dim)), rng.random((count, action_dim)),
+                                   rng.random(count), rng.random((count, state_dim)))
+    return agent
+
+
+def time_calls(fn, iters, repeats):
+    """预热后重复 repeats 次、每次调用 fn iters 次，返回每次调用的耗时（纳秒）列表"""
+    for _ in range(3):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        for _ in range(iters):
+            fn()
+        samples.append((time.perf_counter_ns() - start) / iters)
+    return samples
+
+
+def run(args):
+    variants = ['root', 'test'] if args.variant == 'both' else [args.variant]
+    results = {}
+    cases = itertools.product(variants, args.users, args.batch_sizes or [None], args.soft_update, args.critic_input,
+                              args.profile)
+    for variant, num_users, batch_size, name, critic_input, profile in cases:
+        agent = make_agent(variant, num_users, args.seed, PROFILES[profile](), batch_size)
+        if SOFT_UPDATES[name] is not None:
+            agent.soft_update = lambda agent=agent, fn=SOFT_UPDATES[name]: fn(agent)
+        if CRITIC_INPUTS[critic_input] is not None:
+            CRITIC_INPUTS[critic_input](agent)
+        update_ns = float(np.median(time_calls(agent.update, args.iters, args.repeats)))
+        soft_ns = float(np.median(time_calls(agent.soft_update, args.iters * 10, args.repeats)))
+        key = f"{variant}/{name}/{critic_input}/{profile}/users={num_users}/batch={agent.batch_size}"
+        results[key] = {
+            'variant': variant,
+            'soft_update': name,
+            'critic_input': critic_input,
+            'profile': profile,
+            'num_users': num_users,
+            'batch_size': agent.batch_size,
+            'update_ns': update_ns,
+            'soft_update_ns': soft_ns,
+            'updates_per_sec': 1e9 / update_ns,
+        }
+        print(f"{key:<52} update {update_ns / 1e3:>9.1f} us | soft_update {soft_ns / 1e3:>7.1f} us | "
+              f"{1e9 / update_ns:>7.1f} updates/s")
+    return results
+
+
+def metadata(args):
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'torch_threads': torch.get_num_threads(),
+        'iters': args.iters,
+        'repeats': args.repeats,
+        'seed': args.seed,
+    }
+
+
+def main(args):
+    print(f"iters={args.iters} | repeats={args.repeats} | torch threads={torch.get_num_threads()}")
+    results = run(args)
+    if args.output:
+        report = {'meta': metadata(args), 'results': results}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"结果已写入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: checkpoint.py
+@time: 20/6/2025 上午 10:40
+@functions：训练检查点，周期性保存 agent、优化器、随机数状态和（可选）回放缓冲区，后台线程写盘，支持断点续训
+
+目录结构：
+    ckpt_<episode>.pt    - agent.state_dict()、随机数状态、episode、调用方的附加数据
+    replay_<episode>.pt  - 回放缓冲区快照：完整快照或相对上一次的增量
+    index.json           - 保留的检查点及各自需要依次加载的回放文件链，最后一项为最新检查点
+
+所有文件先写到 .tmp 再 os.replace，index.json 最后更新，崩溃时最多退回上一个完整的检查点。
+"""
+import json
+import os
+import queue
+import random
+import threading
+
+import numpy as np
+import torch
+
+
+def _detached_copy(obj):
+    """递归拷贝 state_dict 中的张量和数组，训练继续修改参数也不影响已提交的快照"""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, np.ndarray):
+        return obj.copy()
+    if isinstance(obj, dict):
+        return {key: _detached_copy(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_detached_copy(value) for value in obj)
+    return obj
+
+
+def _atomic_save(obj, path):
+    tmp = path + '.tmp'
+    torch.save(obj, tmp)
+    os.replace(tmp, path)
+
+
+def rng_state(env=None):
+    """全局 torch/numpy/random 以及环境各随机数流的状态"""
+    state = {
+        'torch': torch.get_rng_state(),
+        'numpy': np.random.get_state(),
+        'python': random.getstate(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    if env is not None and hasattr(env, '_rng'):
+        state['env'] = {name: rng.bit_generator.state for name, rng in env._rng.items()}
+    return state
+
+
+def set_rng_state(state, env=None):
+    torch.set_rng_state(state['torch'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['python'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+    if env is not None and 'env' in state:
+        # 原地恢复，保留其他组件（如 mobility）对同一 Generator 的引用
+        for name, bit_state in state['env'].items():
+            env._rng[name].bit_generator.state = bit_state
+
+
+class Checkpointer:
+    """
+    周期性异步检查点
+
+    save() 在训练线程中只做内存拷贝，写盘由后台线程完成；后台线程仍有未写完的检查点时跳过本次保存
+    （回放增量从上一次实际提交的位置算起，跳过不会丢数据）。
+
+    参数：
+        directory : 检查点目录
+        every : 每隔多少个 episode 保存一次（maybe_save）
+        keep : 保留最近的检查点数
+        save_replay : 是否保存回放缓冲区；首次为完整快照，之后只保存新写入的经验，
+                      累计增量达到缓冲区容量时重新做完整快照
+    """
+
+    def __init__(self, directory, every=50, keep=3, save_replay=False):
+        self.directory = directory
+        self.every = every
+        self.keep = keep
+        self.save_replay = save_replay
+        os.makedirs(directory, exist_ok=True)
+
+        self.index = self._read_index()
+        self._replay_since = None  # 上一次提交的回放快照对应的 total
+        self._replay_chain = []  # 最新检查点需要依次加载的回放文件
+        self._replay_base = 0  # 回放链中完整快照对应的 total
+
+        self._queue = queue.Queue(maxsize=1)
+        self._error = None
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    def _read_index(self):
+        path = os.path.join(self.directory, 'index.json')
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_index(self):
+        path = os.path.join(self.directory, 'index.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def maybe_save(self, agent, episode, env=None, extra=None):
+        """episode 结束时调用，每 every 个 episode 保存一次"""
+        if (episode + 1) % self.every == 0:
+            return self.save(agent, episode, env, extra)
+        return False
+
+    def save(self, agent, episode, env=None, extra=None, block=False):
+        """
+        提交一次检查点
+
+        参数：
+            extra : 需要一并保存的训练状态，例如奖励曲线
+            block : 等待后台线程空闲后再提交（训练结束时使用），否则后台繁忙时跳过
+        返回：
+            是否已提交
+        """
+        self._raise_error()
+        if not block and self._queue.full():
+            return False
+        checkpoint = {
+            'episode': episode,
+            'agent': _detached_copy(agent.state_dict()),
+            'rng': rng_state(env),
+            'extra': _detached_copy(extra),
+        }
+        replay = None
+        if self.save_replay:
+            buffer = agent.replay_buffer
+            full = self._replay_since is None or buffer.total - self._replay_base >= buffer.capacity
+            if full:
+                self._replay_base, self._replay_chain = buffer.total, []
+            replay = buffer.state_dict(since=None if full else self._replay_since)
+            self._replay_since = buffer.total
+            self._replay_chain = self._replay_chain + [f'replay_{episode:06d}.pt']
+        self._queue.put((episode, checkpoint, replay, list(self._replay_chain), self._replay_base))
+        return True
+
+    def _writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            try:
+                self._write(*item)
+            except Exception as error:  # 记录下来，在训练线程中下一次调用时抛出
+                self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _write(self, episode, checkpoint, replay, chain, replay_base):
+        name = f'ckpt_{episode:06d}.pt'
+        if replay is not None:
+            _atomic_save(replay, os.path.join(self.directory, chain[-1]))
+        _atomic_save(checkpoint, os.path.join(self.directory, name))
+        self.index = [entry for entry in self.index if entry['checkpoint'] != name]
+        self.index.append({'checkpoint': name, 'episode': episode, 'replay': chain, 'replay_base': replay_base})
+        removed, self.index = self.index[:-self.keep], self.index[-self.keep:]
+        self._write_index()
+
+        # 删除不再被保留的检查点引用的文件
+        referenced = {entry['checkpoint'] for entry in self.index}
+        referenced.update(f for entry in self.index for f in entry['replay'])
+        for entry in removed:
+            for filename in [entry['checkpoint']] + entry['replay']:
+                path = os.path.join(self.directory, filename)
+                if filename not in referenced and os.path.exists(path):
+                    os.remove(path)
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(f"检查点写入失败: {error}") from error
+
+    def load(self, agent, env=None):
+        """
+        从最新的检查点恢复 agent（及回放缓冲区、随机数状态）
+
+        返回：
+            (episode, extra)，没有检查点时返回 None
+        """
+        if not self.index:
+            return None
+        entry = self.index[-1]
+        checkpoint = torch.load(os.path.join(self.directory, entry['checkpoint']), map_location='cpu',
+                                weights_only=False)
+        agent.load_state_dict(checkpoint['agent'])
+        if self.save_replay and entry['replay']:
+            for filename in entry['replay']:
+                state = torch.load(os.path.join(self.directory, filename), weights_only=False)
+                agent.replay_buffer.load_state_dict(state)
+            self._replay_since = agent.replay_buffer.total
+            self._replay_chain = list(entry['replay'])
+            self._replay_base = entry['replay_base']
+        set_rng_state(checkpoint['rng'], env)
+        return checkpoint['episode'], checkpoint['extra']
+
+    def wait(self):
+        """等待所有已提交的检查点写完"""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        if self._thread.is_alive():
+            self.wait()
+            self._queue.put(None)
+            self._thread.join()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: cpu_profile.py
+@time: 22/6/2025 下午 4:40
+@functions：CPU 执行配置，按批量大小选择算子内线程数、可选 bfloat16 自动混合精度；critic 首层按 (状态, 动作) 预先拆分
+
+64~128 的小批量上多线程分发的开销大于收益，批量较大时才增加线程；CPUProfile 只在线程数需要变化时调用
+torch.set_num_threads，退出时恢复进入前的线程数。bfloat16 autocast 单独作为一个上下文，只包住前向计算，
+反向传播、优化器更新与目标网络软更新仍在 float32 下执行。
+
+用法：
+    agent = DDPGAgent(state_dim, action_dim, cpu_profile=CPUProfile(bf16=True))
+"""
+import math
+
+import torch
+import torch.nn as nn
+
+
+class StateActionLinear(nn.Module):
+    """
+    Critic 的第一层 Linear(state_dim + action_dim, out) 拆成状态、动作两个权重：
+    state @ W_s^T + action @ W_a^T + b，省去每次调用 torch.cat([state, action]) 的拼接分配
+
+    初始化与 nn.Linear(state_dim + action_dim, out) 相同（相同的随机数消耗），
+    旧的 weight/bias 参数在 load_state_dict 时自动拆分。
+    """
+
+    def __init__(self, state_dim, action_dim, out_features):
+        super(StateActionLinear, self).__init__()
+        self.state_dim = state_dim
+        weight = torch.empty(out_features, state_dim + action_dim)
+        nn.init.kaiming_uniform_(weight, a=math.sqrt(5))
+        bound = 1 / math.sqrt(state_dim + action_dim)
+        self.state_weight = nn.Parameter(weight[:, :state_dim].contiguous())
+        self.action_weight = nn.Parameter(weight[:, state_dim:].contiguous())
+        self.bias = nn.Parameter(torch.empty(out_features).uniform_(-bound, bound))
+
+    def forward(self, inputs):
+        # inputs 为 (state, action)，可以直接放在 nn.Sequential 的第一层
+        state, action = inputs
+        return torch.addmm(torch.addmm(self.bias, state, self.state_weight.t()), action, self.action_weight.t())
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        weight = state_dict.pop(prefix + 'weight', None)
+        if weight is not None:  # 拆分前保存的拼接权重
+            state_dict[prefix + 'state_weight'] = weight[:, :self.state_dim]
+            state_dict[prefix + 'action_weight'] = weight[:, self.state_dim:]
+        super(StateActionLinear, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+
+class _ProfileContext:
+    __slots__ = ('threads', 'bf16', 'previous', 'autocast')
+
+    def __init__(self, threads, bf16):
+        self.threads = threads  # None 表示不修改线程数
+        self.bf16 = bf16
+        self.previous = None
+        self.autocast = None
+
+    def __enter__(self):
+        if self.threads is not None:
+            self.previous = set_threads(self.threads)
+        if self.bf16:
+            self.autocast = torch.autocast('cpu', dtype=torch.bfloat16)
+            self.autocast.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if self.autocast is not None:
+                self.autocast.__exit__(*exc)
+                self.autocast = None
+        finally:
+            if self.previous is not None:
+                set_threads(self.previous)
+                self.previous = None
+        return False
+
+
+def set_threads(threads):
+    """把 torch 算子内线程数设为 threads（与当前值相同时不调用 torch.set_num_threads），返回修改前的线程数"""
+    previous = torch.get_num_threads()
+    if threads != previous:
+        torch.set_num_threads(threads)
+    return previous
+
+
+class CPUProfile:
+    """
+    CPU 执行配置
+
+    参数：
+        rows_per_thread : 每个线程至少分到的批量行数，线程数 = clamp(batch // rows_per_thread, 1, max_threads)
+        max_threads : 线程数上限，None 时为创建时的 torch.get_num_threads()
+        bf16 : 前向计算在 torch.autocast('cpu', bfloat16) 下执行（参数、梯度与优化器状态仍为 float32）
+    """
+
+    enabled = True
+
+    def __init__(self, rows_per_thread=256, max_threads=None, bf16=False):
+        self.rows_per_thread = rows_per_thread
+        self.max_threads = max_threads or torch.get_num_threads()
+        self.bf16 = bf16
+
+    def threads_for(self, batch):
+        return max(1, min(self.max_threads, batch // self.rows_per_thread))
+
+    def threads(self, batch):
+        """with profile.threads(batch): ... 按批量设置线程数，退出时恢复"""
+        return _ProfileContext(self.threads_for(batch), False)
+
+    def autocast(self):
+        """with profile.autocast(): ... bf16=True 时进入 bfloat16 autocast，只用于前向计算"""
+        return _ProfileContext(None, self.bf16)
+
+    def context(self, batch):
+        """with profile.context(batch): ... 同时设置线程数与 autocast，用于纯推理"""
+        return _ProfileContext(self.threads_for(batch), self.bf16)
+
+
+class _NullContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+class NullCPUProfile:
+    """默认配置：不修改线程数，float32 执行"""
+
+    enabled = False
+    bf16 = False
+
+    def threads(self, batch):
+        return _NULL_CONTEXT
+
+    def autocast(self):
+        return _NULL_CONTEXT
+
+    def context(self, batch):
+        return _NULL_CONTEXT
+
+
+NULL_PROFILE = NullCPUProfile()
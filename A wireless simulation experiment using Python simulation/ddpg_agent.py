@@ -10,8 +10,9 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 import numpy as np
-import random
-from collections import deque
+from cpu_profile import NULL_PROFILE, StateActionLinear
+from replay import make_replay_buffer
+from telemetry import NULL_TELEMETRY
 
 
 # Actor网络定义
@@ -38,7 +39,7 @@ class Critic(nn.Module):
     def __init__(self, state_dim, action_dim, hidden_dim=256):
         super(Critic, self).__init__()
         self.net = nn.Sequential(
-            nn.Linear(state_dim + action_dim, hidden_dim),
+            StateActionLinear(state_dim, action_dim, hidden_dim),  # 首层按状态/动作拆分，不再拼接输入
             nn.LeakyReLU(),
             nn.Linear(hidden_dim, 128),
             nn.LeakyReLU(),
@@ -48,12 +49,13 @@ class Critic(nn.Module):
         )
 
     def forward(self, state, action):
-        return self.net(torch.cat([state, action], 1))
+        return self.net((state, action))
 
 
 # DDPG Agent类
 class DDPGAgent:
-    def __init__(self, state_dim, action_dim):
+    def __init__(self, state_dim, action_dim, prioritized=False, replay_path=None, policy_delay=1,
+                 target_update_every=1, cpu_profile=None, replay_resume=False):
         self.actor = Actor(state_dim, action_dim)
         self.actor_target = Actor(state_dim, action_dim)
         self.actor_target.load_state_dict(self.actor.state_dict())
@@ -64,54 +66,135 @@ class DDPGAgent:
         self.critic_target.load_state_dict(self.critic.state_dict())
         self.critic_optimizer = optim.Adam(self.critic.parameters(), lr=1e-3)
 
-        self.replay_buffer = deque(maxlen=1000000)
+        # prioritized=True 时按 TD 误差优先采样，critic 损失乘以重要性采样权重；
+        # replay_path 给定时经验存放在该目录的 memmap 文件中，replay_resume=True 时接着使用其中已有的经验
+        self.prioritized = prioritized
+        self.replay_buffer = make_replay_buffer(1000000, state_dim, action_dim, prioritized, replay_path,
+                                                resume=replay_resume)
         self.batch_size = 64
         self.tau = 0.005
         self.gamma = 0.99
+        # 每 policy_delay 次 critic 更新才更新一次 actor 和目标网络（TD3 式延迟策略更新）
+        self.policy_delay = policy_delay
+        self.target_update_every = target_update_every
+        self.num_updates = 0
+        self.telemetry = NULL_TELEMETRY  # 替换为 telemetry.Telemetry 时记录各阶段耗时与损失
+        # cpu_profile.CPUProfile：按批量大小设置线程数、可选 bfloat16 autocast；None 时保持默认执行方式
+        self.cpu_profile = cpu_profile or NULL_PROFILE
+        # 软更新用的参数列表只构建一次
+        self._online_params = list(self.actor.parameters()) + list(self.critic.parameters())
+        self._target_params = list(self.actor_target.parameters()) + list(self.critic_target.parameters())
 
     def select_action(self, state, noise_scale=0.1):
-        state = torch.FloatTensor(state).unsqueeze(0)
-        action = self.actor(state).detach().numpy()[0]
-        # 添加OU噪声促进探索
-        noise = noise_scale * np.random.randn(*action.shape)
-        return np.clip(action + noise, 0, 1)
-
-    def update(self):
+        return self.select_actions(np.asarray(state)[None], noise_scale)[0]
+
+    def select_actions(self, states, noise_scale=0.1, noise=None):
+        """
+        批量选择动作
+
+        参数：
+            states : (N, state_dim) 状态矩阵
+            noise : 噪声过程（exploration.OUNoise 等），None 时为 noise_scale 倍的高斯噪声
+        返回：
+            (N, action_dim) 的连续 float32 数组
+        """
+        states = torch.from_numpy(np.ascontiguousarray(states, dtype=np.float32))
+        with torch.inference_mode(), self.cpu_profile.context(len(states)):
+            actions = self.actor(states).float()
+            # 噪声一次生成整个批量，促进探索
+            if noise is not None:
+                actions += noise.sample()
+            elif noise_scale:
+                actions += noise_scale * torch.randn_like(actions)
+            return actions.clamp_(0, 1).numpy()
+
+    def update(self, num_updates=1):
+        """
+        num_updates 次梯度更新：一次采样 num_updates * batch_size 条经验，再切成 num_updates 个小批量依次更新
+        """
         if len(self.replay_buffer) < self.batch_size:
             return
 
         # 从回放缓冲区采样
-        batch = random.sample(self.replay_buffer, self.batch_size)
-        states = torch.FloatTensor([t[0] for t in batch])
-        actions = torch.FloatTensor([t[1] for t in batch])
-        rewards = torch.FloatTensor([t[2] for t in batch]).unsqueeze(1)
-        next_states = torch.FloatTensor([t[3] for t in batch])
-
-        # Critic更新
-        with torch.no_grad():
-            target_actions = self.actor_target(next_states)
-            target_q = self.critic_target(next_states, target_actions)
-            target_q = rewards + self.gamma * target_q
-
-        current_q = self.critic(states, actions)
-        critic_loss = nn.MSELoss()(current_q, target_q)
-
-        self.critic_optimizer.zero_grad()
-        critic_loss.backward()
-        self.critic_optimizer.step()
+        with self.telemetry.phase('replay_sample'):
+            batch = self.replay_buffer.sample(num_updates * self.batch_size)
+        micro_batches = zip(*(tensor.split(self.batch_size) for tensor in batch[:5]))
+        with self.cpu_profile.threads(self.batch_size):
+            for i, (states, actions, rewards, next_states, dones) in enumerate(micro_batches):
+                weights = indices = None
+                if self.prioritized:
+                    weights = batch[5].split(self.batch_size)[i]
+                    indices = batch[6][i * self.batch_size:(i + 1) * self.batch_size]
+                self._update_step(states, actions, rewards, next_states, dones, weights, indices)
+
+    def _update_step(self, states, actions, rewards, next_states, dones, weights=None, indices=None):
+        telemetry = self.telemetry
+        # Critic更新（bfloat16 autocast 只包住网络前向，输出为 bf16，目标与损失统一在 float32 下计算）
+        with telemetry.phase('critic_forward'), self.cpu_profile.autocast():
+            with torch.no_grad():
+                target_actions = self.actor_target(next_states)
+                target_q = self.critic_target(next_states, target_actions).float()
+                target_q = rewards + self.gamma * (1 - dones) * target_q
+
+            current_q = self.critic(states, actions).float()
+            td_error = target_q - current_q
+            if weights is None:
+                critic_loss = nn.MSELoss()(current_q, target_q)
+            else:
+                critic_loss = (weights * td_error.pow(2)).mean()
+
+        with telemetry.phase('critic_backward'):
+            self.critic_optimizer.zero_grad()
+            critic_loss.backward()
+            self.critic_optimizer.step()
+        telemetry.scalar('critic_loss', critic_loss)
+        if indices is not None:
+            self.replay_buffer.update_priorities(indices, td_error.detach().numpy())
+
+        self.num_updates += 1
+        if self.num_updates % self.policy_delay:
+            return
 
         # Actor更新
-        actor_loss = -self.critic(states, self.actor(states)).mean()
-
-        self.actor_optimizer.zero_grad()
-        actor_loss.backward()
-        self.actor_optimizer.step()
+        with telemetry.phase('actor_forward'), self.cpu_profile.autocast():
+            actor_loss = -self.critic(states, self.actor(states)).mean()
+
+        with telemetry.phase('actor_backward'):
+            self.actor_optimizer.zero_grad()
+            actor_loss.backward()
+            self.actor_optimizer.step()
+        telemetry.scalar('actor_loss', actor_loss)
+
+        # 软更新目标网络（每 target_update_every 次 actor 更新一次）
+        if (self.num_updates // self.policy_delay) % self.target_update_every == 0:
+            with telemetry.phase('soft_update'):
+                self.soft_update()
+
+    def state_dict(self):
+        """网络、目标网络、优化器和更新计数（不含回放缓冲区）"""
+        return {
+            'actor': self.actor.state_dict(),
+            'critic': self.critic.state_dict(),
+            'actor_target': self.actor_target.state_dict(),
+            'critic_target': self.critic_target.state_dict(),
+            'actor_optimizer': self.actor_optimizer.state_dict(),
+            'critic_optimizer': self.critic_optimizer.state_dict(),
+            'num_updates': self.num_updates,
+        }
+
+    def load_state_dict(self, state):
+        for name in ('actor', 'critic', 'actor_target', 'critic_target', 'actor_optimizer', 'critic_optimizer'):
+            getattr(self, name).load_state_dict(state[name])
+        self.num_updates = state['num_updates']
+
+    def soft_update(self):
+        """target <- target + tau * (online - target)，actor 与 critic 的全部参数用一次 foreach 原地完成"""
+        with torch.no_grad():
+            torch._foreach_lerp_(self._target_params, self._online_params, self.tau)
 
-        # 软更新目标网络
-        for param, target_param in zip(self.actor.parameters(), self.actor_target.parameters()):
-            target_param.data.copy_(self.tau * param.data + (1 - self.tau) * target_param.data)
-        for param, target_param in zip(self.critic.parameters(), self.critic_target.parameters()):
-            target_param.data.copy_(self.tau * param.data + (1 - self.tau) * target_param.data)
+    def save_experience(self, state, action, reward, next_state, done=False):
+        self.replay_buffer.push(state, action, reward, next_state, done)
 
-    def save_experience(self, state, action, reward, next_state):
-        self.replay_buffer.append((state, action, reward, next_state))
\ No newline at end of file
+    def save_experience_batch(self, states, actions, rewards, next_states, dones=None):
+        # 向量环境一步产生的 N 条经验一次写入
+        self.replay_buffer.push_batch(states, actions, rewards, next_states, dones)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: env_pool.py
+@time: 3/6/2025 下午 8:40
+@functions：多进程环境池，子进程分片运行 WirelessCommEnv，观测/动作通过共享内存交换
+"""
+import importlib.util
+import multiprocessing as mp
+import os
+import sys
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from rng import spawn_seeds
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+_ENV_FILES = {
+    'root': os.path.join(_BASE_DIR, 'wireless_env.py'),
+    'test': os.path.join(_BASE_DIR, 'test', 'wireless_env.py'),
+}
+_ENV_MODULES = {}
+
+
+def load_env_module(variant='root'):
+    """按文件路径加载指定变体的 wireless_env 模块（两个目录下模块同名，不能直接 import）"""
+    if variant not in _ENV_MODULES:
+        path = _ENV_FILES[variant]
+        env_dir = os.path.dirname(path)
+        if env_dir not in sys.path:
+            sys.path.append(env_dir)  # test 变体的同级模块
+        spec = importlib.util.spec_from_file_location(f'wireless_env_{variant}', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _ENV_MODULES[variant] = module
+    return _ENV_MODULES[variant]
+
+
+def make_env(variant='root', num_users=None, **kwargs):
+    """
+    创建环境实例，配合 functools.partial 作为可 pickle 的环境工厂
+
+    参数：
+        variant : 'root' - 上级目录的 WirelessCommEnv(num_users, num_rb)
+                  'test' - test/ 目录的 WirelessCommEnv(max_users)
+        num_users : 用户数；test 变体中对应 current_num_users
+    """
+    module = load_env_module(variant)
+    if variant == 'root':
+        if num_users is not None:
+            kwargs['num_users'] = num_users
+        return module.WirelessCommEnv(**kwargs)
+    env = module.WirelessCommEnv(**kwargs)
+    if num_users is not None:
+        env.current_num_users = num_users
+    return env
+
+
+def _worker(remote, parent_remote, env_fns, seeds, start, buffers, shapes, max_steps):
+    """子进程：顺序推进本分片内的所有环境，结果直接写入共享内存"""
+    parent_remote.close()
+    obs = np.frombuffer(buffers['obs'], dtype=np.float32).reshape(shapes['obs'])
+    final_obs = np.frombuffer(buffers['final_obs'], dtype=np.float32).reshape(shapes['obs'])
+    actions = np.frombuffer(buffers['actions'], dtype=np.float32).reshape(shapes['actions'])
+    rewards = np.frombuffer(buffers['rewards'], dtype=np.float64)
+    terminations = np.frombuffer(buffers['terminations'], dtype=np.bool_)
+    truncations = np.frombuffer(buffers['truncations'], dtype=np.bool_)
+
+    envs = [fn() for fn in env_fns]
+    if seeds is not None:
+        for env, seed in zip(envs, seeds):
+            env.seed(seed)
+    elapsed = np.zeros(len(envs), dtype=np.int64)
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                infos = []
+                for j, env in enumerate(envs):
+                    i = start + j
+                    next_obs, reward, terminated, truncated, info = env.step(actions[i])
+                    elapsed[j] += 1
+                    if max_steps is not None and elapsed[j] >= max_steps:
+                        truncated = True
+                    if terminated or truncated:
+                        # 同一步内自动重置，结束前的观测保存在 final_obs
+                        final_obs[i] = next_obs
+                        next_obs, _ = env.reset()
+                        elapsed[j] = 0
+                    obs[i] = next_obs
+                    rewards[i] = reward
+                    terminations[i] = terminated
+                    truncations[i] = truncated
+                    if data:
+                        infos.append(info)
+                remote.send(infos if data else None)
+            elif cmd == 'reset':
+                for j, env in enumerate(envs):
+                    obs[start + j], _ = env.reset()
+                elapsed[:] = 0
+                remote.send(None)
+            elif cmd == 'close':
+                for env in envs:
+                    env.close()
+                remote.send(None)
+                break
+            else:
+                raise NotImplementedError(f"未知命令: {cmd}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        remote.close()
+
+
+class SubprocVectorEnv:
+    """
+    进程池向量环境
+
+    num_envs 个环境按顺序切分成 num_workers 个分片，每个子进程负责一个分片。
+    观测、动作、奖励和结束标志保存在共享内存 (RawArray) 中，管道只传递命令，不序列化数组。
+
+    同步模式 (asynchronous=False)：step 等待所有分片完成，返回全部 num_envs 个环境的结果。
+    异步模式 (asynchronous=True)：step_wait 只要有 wait_num 个分片完成就返回，
+    info['env_id'] 给出本次结果对应的环境编号，下一次 step_async 只需为这些环境提供动作。
+
+    给定 seed 时，每个环境得到 SeedSequence.spawn 出的独立子种子，结果与分片方式和进程数无关。
+    """
+
+    def __init__(self, env_fns, num_workers=None, asynchronous=False, wait_num=1,
+                 max_steps=None, return_info=False, context=None, seed=None):
+        self.num_envs = len(env_fns)
+        self.num_workers = min(num_workers or os.cpu_count(), self.num_envs)
+        self.asynchronous = asynchronous
+        self.wait_num = min(wait_num, self.num_workers)
+        self.return_info = return_info
+
+        # 探测单个环境的空间维度
+        probe = env_fns[0]()
+        self.single_observation_space = probe.observation_space
+        self.single_action_space = probe.action_space
+        probe.close()
+        obs_dim = self.single_observation_space.shape[0]
+        act_dim = self.single_action_space.shape[0]
+
+        ctx = mp.get_context(context)
+        shapes = {'obs': (self.num_envs, obs_dim), 'actions': (self.num_envs, act_dim)}
+        buffers = {
+            'obs': ctx.RawArray('f', self.num_envs * obs_dim),
+            'final_obs': ctx.RawArray('f', self.num_envs * obs_dim),
+            'actions': ctx.RawArray('f', self.num_envs * act_dim),
+            'rewards': ctx.RawArray('d', self.num_envs),
+            'terminations': ctx.RawArray('b', self.num_envs),
+            'truncations': ctx.RawArray('b', self.num_envs),
+        }
+        self._obs = np.frombuffer(buffers['obs'], dtype=np.float32).reshape(shapes['obs'])
+        self._final_obs = np.frombuffer(buffers['final_obs'], dtype=np.float32).reshape(shapes['obs'])
+        self._actions = np.frombuffer(buffers['actions'], dtype=np.float32).reshape(shapes['actions'])
+        self._rewards = np.frombuffer(buffers['rewards'], dtype=np.float64)
+        self._terminations = np.frombuffer(buffers['terminations'], dtype=np.bool_)
+        self._truncations = np.frombuffer(buffers['truncations'], dtype=np.bool_)
+
+        # 分片：worker w 负责 self._shards[w] 中的环境
+        self._shards = np.array_split(np.arange(self.num_envs), self.num_workers)
+        self._env_worker = np.zeros(self.num_envs, dtype=np.int64)
+        for w, shard in enumerate(self._shards):
+            self._env_worker[shard] = w
+
+        env_seeds = spawn_seeds(seed, self.num_envs) if seed is not None else None
+
+        self._remotes, self._processes = [], []
+        for shard in self._shards:
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(work_remote, remote, [env_fns[i] for i in shard],
+                      None if env_seeds is None else [env_seeds[i] for i in shard], int(shard[0]),
+                      buffers, shapes, max_steps),
+                daemon=True
+            )
+            process.start()
+            work_remote.close()
+            self._remotes.append(remote)
+            self._processes.append(process)
+
+        self._pending = set()  # 已发送 step 但尚未取回结果的 worker
+        self.closed = False
+
+    def reset(self):
+        self._drain()
+        for remote in self._remotes:
+            remote.send(('reset', None))
+        for remote in self._remotes:
+            remote.recv()
+        return self._obs.copy(), {}
+
+    def step_async(self, actions, env_ids=None):
+        """
+        写入动作并通知对应分片开始推进；env_ids 为 None 时表示全部环境
+
+        子进程总是推进整个分片，env_ids 必须恰好覆盖若干个完整分片（即上一次 step_wait 返回的 info['env_id']），
+        否则分片内未给出动作的环境会沿用旧动作前进。
+        """
+        if env_ids is None:
+            env_ids = np.arange(self.num_envs)
+        env_ids = np.asarray(env_ids)
+        workers = np.unique(self._env_worker[env_ids])
+        covered = np.concatenate([self._shards[w] for w in workers])
+        if len(env_ids) != len(covered) or not np.array_equal(np.sort(env_ids), covered):
+            raise ValueError(f"env_ids 必须覆盖完整的分片 {[self._shards[w].tolist() for w in workers]}")
+        busy = self._pending.intersection(workers.tolist())
+        if busy:
+            raise RuntimeError(f"分片 {sorted(busy)} 仍在运行，请先调用 step_wait")
+        self._actions[env_ids] = actions
+        for w in workers:
+            self._remotes[w].send(('step', self.return_info))
+            self._pending.add(int(w))
+
+    def step_wait(self):
+        """
+        取回结果
+
+        返回：
+            (obs, rewards, terminations, truncations, info)，info['env_id'] 为结果对应的环境编号，
+            info['final_obs'] 为自动重置前的观测（仅对结束的环境有意义）
+        """
+        if not self._pending:
+            raise RuntimeError("没有正在运行的 step，请先调用 step_async")
+        if self.asynchronous:
+            remotes = {self._remotes[w]: w for w in self._pending}
+            ready = set()
+            while len(ready) < min(self.wait_num, len(remotes)):
+                ready.update(wait([r for r in remotes if r not in ready]))
+            workers = sorted(remotes[r] for r in ready)
+        else:
+            workers = sorted(self._pending)
+
+        infos = []
+        for w in workers:
+            result = self._remotes[w].recv()
+            self._pending.discard(w)
+            if self.return_info:
+                infos.extend(result)
+
+        env_ids = np.concatenate([self._shards[w] for w in workers])
+        info = {'env_id': env_ids, 'final_obs': self._final_obs[env_ids]}
+        if self.return_info:
+            info['infos'] = infos
+        return (self._obs[env_ids], self._rewards[env_ids], self._terminations[env_ids].copy(),
+                self._truncations[env_ids].copy(), info)
+
+    def step(self, actions, env_ids=None):
+        self.step_async(actions, env_ids)
+        return self.step_wait()
+
+    def _drain(self):
+        """丢弃所有未取回的异步结果"""
+        for w in list(self._pending):
+            self._remotes[w].recv()
+        self._pending.clear()
+
+    def close(self):
+        if self.closed:
+            return
+        self._drain()
+        for remote in self._remotes:
+            remote.send(('close', None))
+        for remote in self._remotes:
+            remote.recv()
+        for process in self._processes:
+            process.join()
+        self.closed = True
+
+    def __del__(self):
+        if not getattr(self, 'closed', True):
+            self.close()
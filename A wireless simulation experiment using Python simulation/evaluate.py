@@ -28,7 +28,7 @@ def evaluate(algorithm, env, episodes=10):
     energy_list = []
 
     for _ in range(episodes):
-        state = env.reset()
+        state, _ = env.reset()
         total_throughput = 0
         total_energy = 0
         user_throughputs = []
@@ -41,7 +41,7 @@ def evaluate(algorithm, env, episodes=10):
             elif algorithm == "Greedy":
                 action = greedy_scheduler(state)
 
-            _, reward, _, info = env.step(action)
+            _, reward, _, _, info = env.step(action)
 
             # 收集指标
             total_throughput += info['throughput']
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: exploration.py
+@time: 19/6/2025 上午 9:50
+@functions：探索噪声过程，直接在动作所在设备上生成 (num_envs, action_dim) 的噪声，供 select_actions 使用
+"""
+import math
+
+import torch
+
+
+class GaussianNoise:
+    """独立同分布高斯噪声 scale * N(0, 1)"""
+
+    def __init__(self, num_envs, action_dim, scale=0.1, device='cpu', seed=None):
+        self.shape = (num_envs, action_dim)
+        self.scale = scale
+        self.device = torch.device(device)
+        self.generator = torch.Generator(self.device).manual_seed(seed) if seed is not None else None
+
+    def sample(self):
+        return torch.randn(self.shape, generator=self.generator, device=self.device).mul_(self.scale)
+
+    def reset(self, env_ids=None):
+        pass
+
+
+class OUNoise(GaussianNoise):
+    """
+    Ornstein-Uhlenbeck 过程，每个环境一条独立的时间相关噪声轨迹
+
+        x <- x + theta * (mu - x) * dt + sigma * sqrt(dt) * N(0, 1)
+
+    环境结束时用 reset(env_ids) 把对应行恢复为 mu。
+    """
+
+    def __init__(self, num_envs, action_dim, theta=0.15, sigma=0.2, mu=0.0, dt=1.0, device='cpu', seed=None):
+        super(OUNoise, self).__init__(num_envs, action_dim, scale=sigma * math.sqrt(dt), device=device, seed=seed)
+        self.theta = theta
+        self.mu = mu
+        self.dt = dt
+        self.state = torch.full(self.shape, mu, device=self.device)
+
+    def sample(self):
+        drift = (self.mu - self.state).mul_(self.theta * self.dt)
+        self.state += drift.add_(super(OUNoise, self).sample())
+        return self.state
+
+    def reset(self, env_ids=None):
+        if env_ids is None:
+            self.state.fill_(self.mu)
+        else:
+            self.state[torch.as_tensor(env_ids, device=self.device)] = self.mu
+
+
+NOISES = {
+    'gaussian': GaussianNoise,
+    'ou': OUNoise,
+}
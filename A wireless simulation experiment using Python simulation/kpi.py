@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: kpi.py
+@time: 15/6/2025 上午 10:05
+@functions：吞吐量、Jain 公平性、能效等 KPI 的向量化计算，两个环境变体和评估脚本共用
+
+所有函数都接受 (batch, users) 数组（单个时隙可以是 (users,)），无效用户由 mask 排除；
+汇总量通过一次 einsum 同时完成各指标的掩码求和。
+"""
+import numpy as np
+
+RB_BANDWIDTH = 180e3  # 每个资源块带宽（Hz）
+
+
+def throughput_mbps(sinr, bandwidth=RB_BANDWIDTH, out=None):
+    """香农吞吐量 bandwidth * log2(1 + sinr) / 1e6（Mbps），out 给定时原地计算"""
+    out = np.add(sinr, 1, out=out)
+    np.log2(out, out=out)
+    out *= bandwidth
+    out /= 1e6
+    return out
+
+
+def user_kpis(rb_alloc, power, gain, interference, base_delay, out):
+    """
+    test/ 环境的逐用户指标，结果写入 out 中预先分配的数组
+
+    参数：
+        rb_alloc : 资源块分配比例
+        power : 发射功率（瓦）
+        gain : 信道增益
+        interference : 干扰加噪声功率（标量或可广播的数组）
+        base_delay : 基础延迟（ms）
+        out : {'throughput', 'delay', 'packet_loss', 'power', 'energy_efficiency'} -> 与 power 同形状的数组
+    """
+    throughput, delay = out['throughput'], out['delay']
+    packet_loss, energy_efficiency = out['packet_loss'], out['energy_efficiency']
+    if out['power'] is not power:
+        out['power'][...] = power
+
+    # 信干噪比与吞吐量
+    np.multiply(power, gain, out=throughput)
+    throughput /= interference
+    throughput_mbps(throughput, out=throughput)
+
+    # 延迟模型：基础延迟 + 队列延迟（防止除零）
+    np.add(throughput, 1e-6, out=delay)
+    np.divide(10, delay, out=delay)
+    delay += base_delay
+
+    # 丢包率模型：与资源块分配负相关
+    np.multiply(rb_alloc, -0.2, out=packet_loss)
+    packet_loss += 0.25
+    np.clip(packet_loss, 0, 1, out=packet_loss)
+
+    # 能效（Mbps/W）
+    np.add(power, 1e-6, out=energy_efficiency)
+    np.divide(throughput, energy_efficiency, out=energy_efficiency)
+    return out
+
+
+def user_mask(num_users, width):
+    """由每个样本的用户数得到 (batch, width) 掩码"""
+    return np.arange(width) < np.asarray(num_users).reshape(-1, 1)
+
+
+def reduce_kpis(throughput, power, mask=None, delay=None, packet_loss=None):
+    """
+    每个样本（时隙/小区）的汇总指标
+
+    参数：
+        throughput, power, delay, packet_loss : (batch, users) 或 (users,)
+        mask : 与 throughput 同形状的有效用户掩码，None 表示全部有效
+    返回：
+        dict，每项形状 (batch,)（输入为一维时为标量）：
+            num_users, sum_throughput, sum_power, jain, energy_efficiency,
+            以及给定 delay/packet_loss 时的 sum_delay, sum_packet_loss
+    """
+    squeeze = np.ndim(throughput) == 1
+    throughput = np.atleast_2d(throughput).astype(np.float64, copy=False)  # float32 输入也按 float64 累加
+    columns = [throughput, throughput * throughput, np.atleast_2d(power)]
+    names = ['sum_throughput', 'sum_squares', 'sum_power']
+    if delay is not None:
+        columns.append(np.atleast_2d(delay))
+        names.append('sum_delay')
+    if packet_loss is not None:
+        columns.append(np.atleast_2d(packet_loss))
+        names.append('sum_packet_loss')
+
+    # 各指标的掩码求和在一次 einsum 中完成
+    stacked = np.stack(columns, dtype=np.float64)
+    if mask is None:
+        sums = stacked.sum(axis=2)
+        num_users = np.full(throughput.shape[0], throughput.shape[1], dtype=np.float64)
+    else:
+        mask = np.atleast_2d(mask)
+        sums = np.einsum('kbu,bu->kb', stacked, mask.astype(np.float64))
+        num_users = mask.sum(axis=1, dtype=np.float64)
+    result = dict(zip(names, sums))
+
+    # Jain 公平性指数，全部用户吞吐量为0时记为0
+    sum_throughput = result['sum_throughput']
+    result['jain'] = np.divide(sum_throughput ** 2, num_users * result.pop('sum_squares'),
+                               out=np.zeros_like(sum_throughput), where=sum_throughput != 0)
+    result['energy_efficiency'] = sum_throughput / (result['sum_power'] + 1e-6)
+    result['num_users'] = num_users
+    if squeeze:
+        result = {name: value[0] for name, value in result.items()}
+    return result
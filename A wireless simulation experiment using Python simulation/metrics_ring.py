@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: metrics_ring.py
+@time: 14/6/2025 上午 9:40
+@functions：逐时隙 KPI 的预分配环形缓冲区，环境 step 直接把指标写入其中，不再每步分配 info 字典和数组
+"""
+import numpy as np
+
+# test/ 环境每个时隙输出的逐用户指标
+KPI_FIELDS = ('throughput', 'delay', 'packet_loss', 'power', 'energy_efficiency')
+
+
+class MetricsRing:
+    """
+    列式环形缓冲区
+
+    每个指标一列，形状 (capacity, width) 的 float32 数组，第 i 行是一个时隙内所有用户的取值，
+    超出该时隙用户数的部分为0；另有 num_users、reward 两列逐时隙标量。
+    写满后覆盖最早的时隙，window() 按时间顺序取出最近的若干时隙。
+    """
+
+    def __init__(self, capacity, width, fields=KPI_FIELDS, dtype=np.float32):
+        self.capacity = capacity
+        self.width = width
+        self.fields = tuple(fields)
+        self.columns = {name: np.zeros((capacity, width), dtype=dtype) for name in self.fields}
+        self.num_users = np.zeros(capacity, dtype=np.int32)
+        self.reward = np.zeros(capacity, dtype=np.float64)
+        self.cursor = 0  # 下一次写入的行
+        self.count = 0  # 累计写入的时隙数（可超过 capacity）
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def row(self, name, num_users):
+        """当前写入行中指标 name 的前 num_users 个元素（视图，调用方用 out= 直接写入）"""
+        return self.columns[name][self.cursor, :num_users]
+
+    def commit(self, num_users, reward):
+        """结束当前时隙：清零用户数以外的部分，记录标量并前移游标，返回写入的行号"""
+        row = self.cursor
+        for column in self.columns.values():
+            column[row, num_users:] = 0
+        self.num_users[row] = num_users
+        self.reward[row] = reward
+        self.cursor = (row + 1) % self.capacity
+        self.count += 1
+        return row
+
+    def indices(self, last=None):
+        """最近 last 个时隙（默认全部有效时隙）按时间先后的行号"""
+        size = len(self)
+        last = size if last is None else min(last, size)
+        return (self.cursor - last + np.arange(last)) % self.capacity
+
+    def window(self, last=None):
+        """
+        按时间顺序取出最近 last 个时隙的数据（拷贝）
+
+        返回：
+            {指标名: (last, width)，'num_users': (last,)，'reward': (last,)}
+        """
+        rows = self.indices(last)
+        data = {name: column[rows] for name, column in self.columns.items()}
+        data['num_users'] = self.num_users[rows]
+        data['reward'] = self.reward[rows]
+        return data
+
+    def clear(self):
+        self.cursor = 0
+        self.count = 0
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: policy_export.py
+@time: 19/6/2025 下午 5:20
+@functions：把训练好的 actor 导出为 TorchScript 部署文件，PolicyRunner 只加载该文件做推理，并测试各批量下的推理延迟
+
+部署时不再需要 DDPGAgent（critic、目标网络、优化器和 100 万条的回放缓冲区），只有 Actor.forward。
+
+用法：
+    python policy_export.py export --weights ddpg_actor.pth --num_users 10 --output ddpg_actor.ts.pt
+    python policy_export.py export --variant test --network set --weights actor.pth --num_users 50 \
+        --output actor.ts.pt
+    python policy_export.py bench ddpg_actor.ts.pt --threads 1 --output policy_latency.json
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+from agent_loader import load_agent_module
+
+
+def compiled_path(path):
+    """torch.export 程序的保存路径（与 TorchScript 文件同名，后缀 .pt2）"""
+    return os.path.splitext(path)[0] + '.pt2'
+
+
+def export_actor(actor, path, state_dim, compile=False, meta=None):
+    """
+    导出 actor
+
+    参数：
+        path : TorchScript 文件路径，保存冻结（参数内联为常量）后的脚本模块，meta.json 作为附加文件存入其中
+        compile : 同时用 torch.export 保存动态批量的程序到 compiled_path(path)，
+                  供 PolicyRunner(compile=True) 用 torch.compile 编译（集合网络依赖数据相关的形状，不支持）
+        meta : 附加的元数据，例如 {'variant': 'test', 'network': 'set'}
+    返回：
+        写入的文件路径列表
+    """
+    actor = copy.deepcopy(actor).cpu().eval()  # 不修改调用方（可能仍在训练）的模块
+    example = torch.rand(2, state_dim)
+    with torch.no_grad():
+        action_dim = actor(example).shape[1]
+        frozen = torch.jit.freeze(torch.jit.script(actor))
+    meta = dict(meta or {}, state_dim=state_dim, action_dim=action_dim, torch=torch.__version__)
+    torch.jit.save(frozen, path, _extra_files={'meta.json': json.dumps(meta)})
+    paths = [path]
+
+    if compile:
+        batch = torch.export.Dim('batch', min=1, max=65536)
+        program = torch.export.export(actor, (example,), dynamic_shapes=({0: batch},))
+        torch.export.save(program, compiled_path(path))
+        paths.append(compiled_path(path))
+    return paths
+
+
+class PolicyRunner:
+    """
+    轻量推理器：只加载导出的 actor
+
+    参数：
+        path : export_actor 生成的 TorchScript 文件
+        num_threads : torch 算子内并行线程数，None 表示不修改（小批量时 1 个线程通常延迟最低）
+        compile : 加载 torch.export 程序并用 torch.compile 编译（首次调用时编译，耗时较长）
+    """
+
+    def __init__(self, path, num_threads=None, compile=False):
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        extra_files = {'meta.json': ''}
+        self.module = torch.jit.load(path, map_location='cpu', _extra_files=extra_files)
+        self.meta = json.loads(extra_files['meta.json'])
+        self.state_dim = self.meta['state_dim']
+        self.action_dim = self.meta['action_dim']
+        if compile:
+            self.module = torch.compile(torch.export.load(compiled_path(path)).module(), dynamic=True)
+
+    def __call__(self, states):
+        """(N, state_dim) 或 (state_dim,) 的状态 -> 对应形状的 float32 动作（无探索噪声）"""
+        states = np.ascontiguousarray(states, dtype=np.float32)
+        single = states.ndim == 1
+        with torch.inference_mode():
+            actions = self.module(torch.from_numpy(states[None] if single else states)).numpy()
+        return actions[0] if single else actions
+
+
+def load_actor(variant, weights, num_users, network='mlp'):
+    """按训练时的结构创建 actor 并加载 state_dict"""
+    module = load_agent_module(variant)
+    state_dim, action_dim = 4 * num_users, 2 * num_users
+    actor_cls = module.NETWORKS[network][0] if variant == 'test' else module.Actor
+    actor = actor_cls(state_dim, action_dim)
+    if weights:
+        actor.load_state_dict(torch.load(weights, map_location='cpu'))
+    return actor, state_dim
+
+
+def random_states(batch, state_dim, rng):
+    """有效取值的随机观测（集合网络按逐用户布局读取，全部填满即 max_users 个用户都有效）"""
+    return rng.uniform(0.2, 1, (batch, state_dim)).astype(np.float32)
+
+
+def bench_latency(fn, states, iters, repeats):
+    """预热后重复 repeats 次、每次调用 iters 次，返回单次调用耗时的中位数（纳秒）"""
+    for _ in range(3):
+        fn(states)
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        for _ in range(iters):
+            fn(states)
+        samples.append((time.perf_counter_ns() - start) / iters)
+    return float(np.median(samples))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='actor 导出与推理延迟测试')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export = sub.add_parser('export', help='导出 TorchScript actor')
+    export.add_argument('--variant', type=str, default='root', choices=['root', 'test'], help='agent 变体')
+    export.add_argument('--network', type=str, default='mlp', choices=['mlp', 'set'], help='test 变体的网络结构')
+    export.add_argument('--weights', type=str, default=None, help='actor 的 state_dict（.pth），不给时导出随机初始化的网络')
+    export.add_argument('--num_users', type=int, default=10, help='用户数（test 变体为 max_users）')
+    export.add_argument('--output', type=str, required=True, help='TorchScript 输出路径')
+    export.add_argument('--compile', action='store_true', help='同时保存 torch.export 程序')
+
+    bench = sub.add_parser('bench', help='推理延迟测试')
+    bench.add_argument('path', type=str, help='TorchScript 文件')
+    bench.add_argument('--threads', type=int, default=None, help='torch 线程数')
+    bench.add_argument('--compile', action='store_true', help='使用 torch.compile 编译的程序')
+    bench.add_argument('--batch_sizes', type=int, nargs='+', default=[2 ** i for i in range(11)],
+                       help='批量大小列表（默认 1..1024）')
+    bench.add_argument('--iters', type=int, default=200, help='每次计时的调用次数')
+    bench.add_argument('--repeats', type=int, default=5, help='重复计时次数（取中位数）')
+    bench.add_argument('--seed', type=int, default=0, help='随机种子')
+    bench.add_argument('--output', type=str, default=None, help='结果 JSON 路径')
+    return parser.parse_args()
+
+
+def run_export(args):
+    actor, state_dim = load_actor(args.variant, args.weights, args.num_users, args.network)
+    paths = export_actor(actor, args.output, state_dim, compile=args.compile,
+                         meta={'variant': args.variant, 'network': args.network})
+    print(f"已导出: {', '.join(paths)}")
+
+
+def run_bench(args):
+    runner = PolicyRunner(args.path, num_threads=args.threads, compile=args.compile)
+    rng = np.random.default_rng(args.seed)
+    print(f"{args.path} | state_dim={runner.state_dim} | threads={torch.get_num_threads()} | compile={args.compile}")
+    results = {}
+    for batch in args.batch_sizes:
+        states = random_states(batch, runner.state_dim, rng)
+        ns = bench_latency(runner, states, max(1, args.iters // max(1, batch // 64)), args.repeats)
+        results[str(batch)] = {'batch': batch, 'ns_per_call': ns, 'ns_per_state': ns / batch,
+                               'states_per_sec': batch * 1e9 / ns}
+        print(f"batch={batch:<5} {ns / 1e3:>10.1f} us/call {ns / batch / 1e3:>8.2f} us/state "
+              f"{batch * 1e9 / ns:>12.0f} states/s")
+    if args.output:
+        report = {'meta': dict(runner.meta, threads=torch.get_num_threads(), compile=args.compile,
+                               timestamp=time.strftime('%Y-%m-%dT%H:%M:%S')),
+                  'results': results}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+def main(args):
+    if args.command == 'export':
+        run_export(args)
+    else:
+        run_bench(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
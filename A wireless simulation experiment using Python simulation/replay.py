@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: replay.py
+@time: 16/6/2025 上午 9:15
+@functions：经验回放，每个字段一个预分配的连续 float32 数组，两个 DDPGAgent 共用
+"""
+import json
+import os
+
+import numpy as np
+import torch
+
+
+def _shape(dim):
+    return (dim,) if np.isscalar(dim) else tuple(dim)
+
+
+class ReplayBuffer:
+    """
+    预分配的环形经验回放
+
+    states/actions/rewards/next_states/dones 各占一个 (capacity, ...) 的 float32 数组，插入为 O(1) 的行拷贝，
+    写满后覆盖最早的经验。采样时用 np.take 把选中的行直接写进复用的 torch 张量
+    （使用 GPU 时为页锁定内存，随后以 non_blocking 方式拷贝到设备）。
+
+    每种批量大小有 STAGING_SETS 组采样张量轮换使用；GPU 上每组在拷贝后记录 CUDA 事件，
+    再次写入该组前等待事件完成，避免覆盖仍在传输的页锁定内存。
+    注意：sample 返回的 CPU 张量在之后第 STAGING_SETS 次同样大小的 sample 时会被覆盖，需要保留时请自行 clone。
+    """
+
+    FIELDS = ('states', 'actions', 'rewards', 'next_states', 'dones')
+    STAGING_SETS = 2
+
+    def __init__(self, capacity, state_dim, action_dim, device='cpu', pin_memory=None, seed=None):
+        self.capacity = capacity
+        self.device = torch.device(device)
+        self.pin_memory = self.device.type == 'cuda' if pin_memory is None else pin_memory
+        self.state_shape = _shape(state_dim)
+        self.action_shape = _shape(action_dim)
+
+        # np.zeros 按需分配物理页，未写入的部分不占内存
+        self.states = np.zeros((capacity,) + self.state_shape, dtype=np.float32)
+        self.actions = np.zeros((capacity,) + self.action_shape, dtype=np.float32)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity,) + self.state_shape, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.float32)
+
+        self.position = 0  # 下一次写入的位置
+        self.size = 0
+        self.total = 0  # 累计写入的经验数（可超过 capacity），用于增量保存
+        self.rng = np.random.default_rng(seed)
+        self._staging = {}  # batch_size -> [各字段的采样张量, ...]，轮换使用
+        self._staging_turn = {}  # batch_size -> 下一次使用的组号
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        """全部字段写满时占用的字节数"""
+        return sum(getattr(self, name).nbytes for name in self.FIELDS)
+
+    def push(self, state, action, reward, next_state, done=False):
+        """写入一条经验（拷贝为 float32：环境可能复用观测缓冲区）"""
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.total += 1
+        return i
+
+    def push_batch(self, states, actions, rewards, next_states, dones=None):
+        """一次写入一批经验（例如向量环境的一步），返回写入的位置"""
+        count = len(rewards)
+        index = (self.position + np.arange(count)) % self.capacity
+        self.states[index] = states
+        self.actions[index] = actions
+        self.rewards[index] = rewards
+        self.next_states[index] = next_states
+        self.dones[index] = 0 if dones is None else dones
+        self.position = int((self.position + count) % self.capacity)
+        self.size = min(self.size + count, self.capacity)
+        self.total += count
+        return index
+
+    def sample_indices(self, batch_size):
+        """有放回均匀采样"""
+        return self.rng.integers(0, self.size, batch_size)
+
+    def _staging_tensors(self, batch_size):
+        """取下一组采样张量；该组上一次的异步拷贝尚未完成时先等待"""
+        sets = self._staging.get(batch_size)
+        if sets is None:
+            sets = self._staging[batch_size] = [
+                {name: torch.empty((batch_size,) + getattr(self, name).shape[1:], dtype=torch.float32,
+                                   pin_memory=self.pin_memory)
+                 for name in self.FIELDS}
+                for _ in range(self.STAGING_SETS)
+            ]
+        turn = self._staging_turn.get(batch_size, 0)
+        self._staging_turn[batch_size] = (turn + 1) % self.STAGING_SETS
+        staging = sets[turn]
+        event = staging.pop('event', None)
+        if event is not None:
+            event.synchronize()
+        return staging
+
+    def _transfer(self, staging):
+        """把写好的采样张量拷贝到设备，GPU 上记录拷贝完成事件"""
+        non_blocking = self.pin_memory and self.device.type == 'cuda'
+        batch = [staging[name].to(self.device, non_blocking=non_blocking) for name in self.FIELDS]
+        if non_blocking:
+            staging['event'] = torch.cuda.Event()
+            staging['event'].record()
+        batch[2] = batch[2].unsqueeze(1)
+        batch[4] = batch[4].unsqueeze(1)
+        return tuple(batch)
+
+    def gather(self, indices):
+        """
+        按下标取出一批经验
+
+        返回：
+            (states, actions, rewards, next_states, dones) 张量，rewards/dones 形状为 (batch, 1)
+        """
+        staging = self._staging_tensors(len(indices))
+        for name in self.FIELDS:
+            np.take(getattr(self, name), indices, axis=0, out=staging[name].numpy())
+        return self._transfer(staging)
+
+    def sample(self, batch_size):
+        return self.gather(self.sample_indices(batch_size))
+
+    def state_dict(self, since=None):
+        """
+        回放状态，用于断点续训
+
+        参数：
+            since : 上一次保存时的 total；给定且此后写入不超过 capacity 条时只保存新写入的行（增量），
+                    否则保存全部有效行
+        返回：
+            dict，'full' 表示是否为完整快照，'rows' 为保存的行号，各字段为对应行的拷贝
+        """
+        new_rows = None if since is None else self.total - since
+        full = new_rows is None or new_rows >= self.capacity
+        if full:
+            rows = np.arange(self.size)
+        else:
+            rows = (self.position - new_rows + np.arange(new_rows)) % self.capacity
+        state = {
+            'full': full,
+            'rows': rows,
+            'position': self.position,
+            'size': self.size,
+            'total': self.total,
+            'rng': self.rng.bit_generator.state,
+        }
+        for name in self.FIELDS:
+            state[name] = getattr(self, name)[rows]
+        return state
+
+    def load_state_dict(self, state):
+        """恢复 state_dict 的结果；增量快照需按保存顺序依次加载在完整快照之后"""
+        rows = state['rows']
+        for name in self.FIELDS:
+            getattr(self, name)[rows] = state[name]
+        self.position, self.size, self.total = state['position'], state['size'], state['total']
+        self.rng.bit_generator.state = state['rng']
+
+
+class SumTree:
+    """
+    基于数组的求和树
+
+    叶子位于 tree[size:2*size]（size 为不小于容量的 2 的幂），tree[i] = tree[2i] + tree[2i+1]，tree[1] 为总和。
+    更新和采样都按层向量化：一批下标逐层上溯/下降，每层一次 NumPy 操作，复杂度 O(batch * log n)。
+    """
+
+    def __init__(self, capacity):
+        self.size = 1
+        while self.size < capacity:
+            self.size *= 2
+        self.depth = self.size.bit_length() - 1
+        self.tree = np.zeros(2 * self.size, dtype=np.float64)
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def __getitem__(self, indices):
+        return self.tree[self.size + np.asarray(indices)]
+
+    def update(self, indices, priorities):
+        nodes = self.size + np.asarray(indices)
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """对每个前缀和 values 找到叶子下标 i，使 sum(p[:i]) <= value < sum(p[:i+1])"""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values >= left_sum
+            values -= np.where(go_right, left_sum, 0.0)
+            nodes = left + go_right
+        return nodes - self.size
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    优先经验回放（Schaul et al. 2016 的比例优先级版本）
+
+    采样概率 P(i) = p_i^alpha / sum_k p_k^alpha，p_i = |TD 误差| + eps，新经验使用当前最大优先级；
+    重要性采样权重 w_i = (N * P(i))^-beta / max(w)，beta 在 beta_steps 次采样内从 beta 线性增加到 1。
+    """
+
+    def __init__(self, capacity, state_dim, action_dim, alpha=0.6, beta=0.4, beta_steps=100000,
+                 eps=1e-6, **kwargs):
+        super(PrioritizedReplayBuffer, self).__init__(capacity, state_dim, action_dim, **kwargs)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = (1.0 - beta) / beta_steps
+        self.eps = eps
+        self.tree = SumTree(capacity)
+        self.max_priority = 1.0  # 已是 alpha 次幂后的值
+
+    def push(self, state, action, reward, next_state, done=False):
+        index = super(PrioritizedReplayBuffer, self).push(state, action, reward, next_state, done)
+        self.tree.update([index], self.max_priority)
+        return index
+
+    def push_batch(self, states, actions, rewards, next_states, dones=None):
+        index = super(PrioritizedReplayBuffer, self).push_batch(states, actions, rewards, next_states, dones)
+        self.tree.update(index, self.max_priority)
+        return index
+
+    def sample_indices(self, batch_size):
+        """分层采样：把总优先级均分为 batch_size 段，每段内均匀抽一个前缀和"""
+        total = self.tree.total
+        segment = total / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        indices = self.tree.find(np.minimum(values, total * (1 - 1e-12)))
+        return np.minimum(indices, self.size - 1)
+
+    def sample(self, batch_size):
+        """
+        返回：
+            (states, actions, rewards, next_states, dones, weights, indices)，
+            weights 为 (batch, 1) 的重要性采样权重张量，indices 用于 update_priorities
+        """
+        indices = self.sample_indices(batch_size)
+        probs = self.tree[indices] / self.tree.total
+        weights = (self.size * probs) ** (-self.beta)
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        weights = torch.from_numpy(weights.astype(np.float32)).unsqueeze(1).to(self.device)
+        return self.gather(indices) + (weights, indices)
+
+    def update_priorities(self, indices, td_errors):
+        """用本次更新的 TD 误差刷新被采样经验的优先级"""
+        priorities = (np.abs(np.asarray(td_errors, dtype=np.float64)).ravel() + self.eps) ** self.alpha
+        self.tree.update(indices, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+    def state_dict(self, since=None):
+        # 旧经验的优先级随训练变化，优先级总是完整保存
+        state = super(PrioritizedReplayBuffer, self).state_dict(since)
+        state.update(priorities=self.tree[np.arange(self.size)], max_priority=self.max_priority, beta=self.beta)
+        return state
+
+    def load_state_dict(self, state):
+        super(PrioritizedReplayBuffer, self).load_state_dict(state)
+        self.tree.update(np.arange(len(state['priorities'])), state['priorities'])
+        self.max_priority, self.beta = state['max_priority'], state['beta']
+
+
+class MemmapReplayBuffer(ReplayBuffer):
+    """
+    磁盘回放：每个字段一个 np.memmap 文件，容量只受磁盘限制
+
+    最近 hot_capacity 条经验同时保存在内存中的环形热缓存里：新经验先写入热缓存，
+    每攒够 flush_rows 条再整块写入 memmap 并更新 meta.json（原子替换），采样时较新的经验直接从内存读取。
+    resume=True 时接着使用目录中已有的同样形状的缓冲区（断点续训），崩溃时最多丢失最后一个未写盘的块；
+    resume=False 时目录中已有经验会报错，避免新的训练误用旧经验。
+
+    目录结构：
+        meta.json      - 版本、容量、字段形状、position、size、total
+        <field>.f32    - 形状 (capacity, ...) 的 float32 数组
+    """
+
+    VERSION = 1
+
+    def __init__(self, capacity, state_dim, action_dim, path, hot_capacity=65536, flush_rows=4096,
+                 resume=False, **kwargs):
+        # 先用容量0初始化公共属性，字段数组稍后换成 memmap
+        super(MemmapReplayBuffer, self).__init__(0, state_dim, action_dim, **kwargs)
+        self.capacity = capacity
+        self.path = path
+        self.hot_capacity = min(hot_capacity, capacity)
+        self.flush_rows = min(flush_rows, self.hot_capacity)
+        shapes = self._field_shapes()
+
+        os.makedirs(path, exist_ok=True)
+        meta = self._read_meta()
+        if meta is not None and not resume:
+            if meta['total']:
+                raise FileExistsError(f"{path} 中已有 {meta['size']} 条经验：断点续训请使用 --resume（resume=True），"
+                                      f"新的训练请使用新目录或先删除该目录")
+            meta = None
+        if meta is not None:
+            if meta['capacity'] != capacity or meta['shapes'] != {k: list(v) for k, v in shapes.items()}:
+                raise ValueError(f"{path} 中的回放缓冲区形状与当前配置不一致")
+            self.position, self.size, self.total = meta['position'], meta['size'], meta['total']
+        mode = 'r+' if meta is not None else 'w+'
+        for name, shape in shapes.items():
+            setattr(self, name, np.memmap(os.path.join(path, f'{name}.f32'), dtype=np.float32, mode=mode,
+                                          shape=(capacity,) + shape))
+
+        self._hot = {name: np.zeros((self.hot_capacity,) + shape, dtype=np.float32) for name, shape in shapes.items()}
+        self._hot_position = 0  # 热缓存的下一个写入槽位
+        self._hot_count = 0  # 热缓存中有效的经验数
+        self._pending = 0  # 已写入热缓存、尚未写盘的经验数
+        if meta is None:
+            self._write_meta()
+
+    def _field_shapes(self):
+        return {
+            'states': self.state_shape,
+            'actions': self.action_shape,
+            'rewards': (),
+            'next_states': self.state_shape,
+            'dones': (),
+        }
+
+    def _read_meta(self):
+        meta_path = os.path.join(self.path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta['version'] != self.VERSION:
+            raise ValueError(f"不支持的回放缓冲区版本: {meta['version']}")
+        return meta
+
+    def _write_meta(self):
+        meta = {
+            'version': self.VERSION,
+            'capacity': self.capacity,
+            'shapes': {name: list(shape) for name, shape in self._field_shapes().items()},
+            'position': self.position,
+            'size': self.size,
+            'total': self.total,
+        }
+        tmp = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, 'meta.json'))
+
+    def push(self, state, action, reward, next_state, done=False):
+        return self.push_batch([state], [action], [reward], [next_state], [done])[0]
+
+    def push_batch(self, states, actions, rewards, next_states, dones=None):
+        count = len(rewards)
+        if count > self.hot_capacity:
+            raise ValueError(f"一次最多写入 hot_capacity={self.hot_capacity} 条经验")
+        if self._pending + count > self.hot_capacity:
+            self.flush()
+        slots = (self._hot_position + np.arange(count)) % self.hot_capacity
+        hot = self._hot
+        hot['states'][slots] = states
+        hot['actions'][slots] = actions
+        hot['rewards'][slots] = rewards
+        hot['next_states'][slots] = next_states
+        hot['dones'][slots] = 0 if dones is None else dones
+
+        index = (self.position + np.arange(count)) % self.capacity
+        self._hot_position = int((self._hot_position + count) % self.hot_capacity)
+        self._hot_count = min(self._hot_count + count, self.hot_capacity)
+        self._pending += count
+        self.position = int((self.position + count) % self.capacity)
+        self.size = min(self.size + count, self.capacity)
+        self.total += count
+        if self._pending >= self.flush_rows:
+            self.flush()
+        return index
+
+    def flush(self):
+        """把热缓存中未写盘的经验写入 memmap，同步到磁盘后更新 meta.json"""
+        if self._pending:
+            offsets = np.arange(-self._pending, 0)
+            rows = (self.position + offsets) % self.capacity
+            slots = (self._hot_position + offsets) % self.hot_capacity
+            for name, hot in self._hot.items():
+                disk = getattr(self, name)
+                disk[rows] = hot[slots]
+                disk.flush()
+            self._pending = 0
+        self._write_meta()
+
+    def state_dict(self, since=None):
+        """经验本身已在磁盘上，写盘后只保存计数和随机数状态"""
+        self.flush()
+        return {'full': False, 'position': self.position, 'size': self.size, 'total': self.total,
+                'rng': self.rng.bit_generator.state}
+
+    def load_state_dict(self, state):
+        # 位置与大小以磁盘上的 meta.json 为准（可能比检查点更新）
+        self.rng.bit_generator.state = state['rng']
+
+    def sample_indices(self, batch_size):
+        # 排序后按文件顺序读取 memmap，局部性更好（批内顺序不影响训练）
+        return np.sort(super(MemmapReplayBuffer, self).sample_indices(batch_size))
+
+    def gather(self, indices):
+        indices = np.asarray(indices)
+        age = (self.position - 1 - indices) % self.capacity  # 0 为最新的经验
+        in_hot = age < self._hot_count
+        slots = (self._hot_position - 1 - age[in_hot]) % self.hot_capacity
+        cold = indices[~in_hot]
+
+        staging = self._staging_tensors(len(indices))
+        for name in self.FIELDS:
+            out = staging[name].numpy()
+            out[in_hot] = self._hot[name][slots]
+            if len(cold):
+                out[~in_hot] = getattr(self, name)[cold]
+        return self._transfer(staging)
+
+
+def make_replay_buffer(capacity, state_dim, action_dim, prioritized=False, replay_path=None, resume=False, **kwargs):
+    """按配置创建经验回放（内存 / 优先 / 磁盘 memmap）；resume 只对 replay_path 有效，表示接着使用目录中已有的经验"""
+    if replay_path is not None:
+        if prioritized:
+            raise ValueError("优先经验回放暂不支持 replay_path")
+        return MemmapReplayBuffer(capacity, state_dim, action_dim, replay_path, resume=resume, **kwargs)
+    buffer_cls = PrioritizedReplayBuffer if prioritized else ReplayBuffer
+    return buffer_cls(capacity, state_dim, action_dim, **kwargs)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: rng.py
+@time: 12/6/2025 上午 11:30
+@functions：基于 SeedSequence 的随机数流，每个环境、每个随机组件各自独立，不共享全局 np.random 状态
+"""
+import numpy as np
+
+
+def as_seed_sequence(seed=None):
+    """int / None / SeedSequence 统一转换为 SeedSequence（None 时从系统熵源取种子）"""
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def spawn_seeds(seed, n):
+    """为 n 个环境或 worker 派生相互独立的子种子"""
+    return as_seed_sequence(seed).spawn(n)
+
+
+def make_streams(seed, names):
+    """
+    为每个随机组件派生一个独立的 Generator
+
+    参数：
+        seed : int / None / SeedSequence
+        names : 组件名，例如 ('positions', 'shadowing', 'delay')
+    返回：
+        {组件名: np.random.Generator}
+    """
+    children = as_seed_sequence(seed).spawn(len(names))
+    return {name: np.random.default_rng(child) for name, child in zip(names, children)}
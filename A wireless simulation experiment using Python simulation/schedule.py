@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: schedule.py
+@time: 18/6/2025 上午 10:15
+@functions：训练调度，每采集 K 个环境步做 M 次梯度更新（update-to-data 比例 M/K），两个 train.py 共用
+"""
+
+
+class UpdateSchedule:
+    """
+    每累计 collect_steps 个环境步调用一次 agent.update(num_updates=updates)
+
+    agent.update 一次采样 updates * batch_size 条经验再切成小批量，
+    K、M 同时放大时更新/数据比例不变，但采样和 Python 调用开销被摊薄。
+    默认 K=M=1 与每步更新一次相同。
+    """
+
+    def __init__(self, collect_steps=1, updates=1):
+        self.collect_steps = collect_steps
+        self.updates = updates
+        self._pending = 0  # 尚未触发更新的环境步数
+
+    @property
+    def ratio(self):
+        return self.updates / self.collect_steps
+
+    def step(self, agent, env_steps=1):
+        """记录 env_steps 个新环境步（向量环境一次 step 为 num_envs 步），达到 K 步时执行更新，返回本次的更新次数"""
+        self._pending += env_steps
+        rounds, self._pending = divmod(self._pending, self.collect_steps)
+        if rounds:
+            agent.update(num_updates=rounds * self.updates)
+        return rounds * self.updates
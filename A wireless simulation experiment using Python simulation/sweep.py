@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: sweep.py
+@time: 22/6/2025 下午 2:15
+@functions：超参数搜索，网格/随机搜索空间，进程池并行试验，逐次减半提前淘汰差的配置，按配置哈希缓存结果
+
+搜索空间（JSON）：列表表示候选值，{"uniform": [a, b]} / {"loguniform": [a, b]} 表示连续分布（仅随机搜索）
+    {"tau": [0.001, 0.005, 0.01], "gamma": [0.95, 0.99], "actor_lr": {"loguniform": [1e-5, 1e-3]},
+     "critic_lr": [1e-4, 1e-3], "batch_size": [64, 128], "num_users": [10]}
+
+逐次减半：第一轮所有配置训练 min_episodes 个 episode，按得分保留前 1/eta，预算乘以 eta 后继续训练
+（从上一轮保存的 agent 与回放状态接着训练），直到 max_episodes。
+
+用法：
+    python sweep.py --mode grid --workers 4 --threads 1
+    python sweep.py --space space.json --mode random --samples 27 --min_episodes 5 --max_episodes 45 --eta 3
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from checkpoint import rng_state, set_rng_state
+from ddpg_agent import DDPGAgent
+from wireless_env import WirelessCommEnv
+
+DEFAULT_SPACE = {
+    'tau': [0.001, 0.005, 0.02],
+    'gamma': [0.95, 0.99],
+    'actor_lr': [1e-4, 1e-3],
+    'critic_lr': [1e-3],
+    'batch_size': [64, 128],
+    'num_users': [10],
+}
+# 搜索空间中未给出的参数取 DDPGAgent / train.py 的默认值
+DEFAULTS = {'tau': 0.005, 'gamma': 0.99, 'actor_lr': 1e-4, 'critic_lr': 1e-3, 'batch_size': 64, 'num_users': 10}
+
+
+def grid_configs(space):
+    """网格搜索：所有候选值的笛卡尔积"""
+    for name, values in space.items():
+        if not isinstance(values, list):
+            raise ValueError(f"网格搜索中 {name} 必须是候选值列表")
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_configs(space, samples, seed=None):
+    """随机搜索：列表均匀抽取，uniform / loguniform 按区间抽样"""
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(samples):
+        config = {}
+        for name, spec in space.items():
+            if isinstance(spec, list):
+                config[name] = spec[rng.integers(len(spec))]
+            elif 'uniform' in spec:
+                config[name] = float(rng.uniform(*spec['uniform']))
+            elif 'loguniform' in spec:
+                low, high = np.log(spec['loguniform'])
+                config[name] = float(np.exp(rng.uniform(low, high)))
+            else:
+                raise ValueError(f"未知的搜索空间定义: {name}={spec}")
+        configs.append(config)
+    return configs
+
+
+def config_hash(config, seed):
+    """配置 + 种子的哈希，作为缓存键（与参数顺序无关）"""
+    text = json.dumps({'config': config, 'seed': seed}, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def make_agent(config):
+    config = dict(DEFAULTS, **config)
+    env = WirelessCommEnv(num_users=config['num_users'])
+    agent = DDPGAgent(env.observation_space.shape[0], env.action_space.shape[0])
+    agent.tau = config['tau']
+    agent.gamma = config['gamma']
+    agent.batch_size = int(config['batch_size'])
+    for optimizer, lr in ((agent.actor_optimizer, config['actor_lr']), (agent.critic_optimizer, config['critic_lr'])):
+        for group in optimizer.param_groups:
+            group['lr'] = lr
+    return env, agent
+
+
+def run_trial(config, episodes, seed, threads, max_steps, state_path, score_window):
+    """
+    训练一个配置到 episodes 个 episode（子进程中执行）
+
+    state_path 存在时从中恢复已训练的 episode、agent 与回放状态，只补足剩余的 episode；结束后写回。
+    得分为最近 score_window 个 episode 的平均每用户每步奖励（不同用户数之间可比）。
+    """
+    torch.set_num_threads(threads)
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    env, agent = make_agent(config)
+    env.seed(seed)
+    num_users = env.num_users
+
+    done, rewards = 0, []
+    saved = torch.load(state_path, weights_only=False) if state_path and os.path.exists(state_path) else None
+    if saved is not None and saved['episodes'] <= episodes:  # 状态已超过本轮预算时重新训练
+        agent.load_state_dict(saved['agent'])
+        agent.replay_buffer.load_state_dict(saved['replay'])
+        set_rng_state(saved['rng'], env)
+        done, rewards = saved['episodes'], saved['rewards']
+
+    start = time.perf_counter()
+    for _ in range(done, episodes):
+        state, _ = env.reset()
+        total_reward = 0.0
+        for _ in range(max_steps):
+            action = agent.select_action(state)
+            next_state, reward, terminated, truncated, _ = env.step(action)
+            agent.save_experience(state, action, reward, next_state)
+            agent.update()
+            state = next_state
+            total_reward += reward
+            if terminated or truncated:
+                break
+        rewards.append(total_reward / (num_users * max_steps))
+
+    if state_path:
+        tmp = state_path + '.tmp'
+        torch.save({'agent': agent.state_dict(), 'replay': agent.replay_buffer.state_dict(), 'rng': rng_state(env),
+                    'episodes': episodes, 'rewards': rewards}, tmp)
+        os.replace(tmp, state_path)
+    return {
+        'config': config,
+        'episodes': episodes,
+        'score': float(np.mean(rewards[-score_window:])),
+        'rewards': rewards,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+class ResultCache:
+    """已完成试验的结果缓存：<directory>/results/<哈希>_<episodes>.json，训练状态在 <directory>/state/"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'results'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'state'), exist_ok=True)
+
+    def result_path(self, key, episodes):
+        return os.path.join(self.directory, 'results', f'{key}_{episodes}.json')
+
+    def state_path(self, key):
+        return os.path.join(self.directory, 'state', f'{key}.pt')
+
+    def get(self, key, episodes):
+        path = self.result_path(key, episodes)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def put(self, key, episodes, result):
+        path = self.result_path(key, episodes)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(result, f)
+        os.replace(path + '.tmp', path)
+
+
+def rung_budgets(min_episodes, max_episodes, eta):
+    """逐次减半各轮的 episode 预算，例如 (5, 45, 3) -> [5, 15, 45]"""
+    budgets = [min_episodes]
+    while budgets[-1] < max_episodes:
+        budgets.append(min(budgets[-1] * eta, max_episodes))
+    return budgets
+
+
+def run_sweep(configs, args):
+    cache = ResultCache(args.cache)
+    keys = [config_hash(config, args.seed) for config in configs]
+    alive = list(range(len(configs)))
+    results = {}
+    budgets = rung_budgets(args.min_episodes, args.max_episodes, args.eta)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for rung, episodes in enumerate(budgets):
+            pending = {}
+            for i in alive:
+                cached = cache.get(keys[i], episodes)
+                if cached is not None:
+                    results[i] = cached
+                    continue
+                pending[i] = pool.submit(run_trial, configs[i], episodes, args.seed, args.threads, args.max_steps,
+                                         cache.state_path(keys[i]), args.score_window)
+            for i, future in pending.items():
+                results[i] = future.result()
+                cache.put(keys[i], episodes, results[i])
+
+            ranked = sorted(alive, key=lambda i: results[i]['score'], reverse=True)
+            print(f"\n第 {rung + 1} 轮：{len(alive)} 个配置 × {episodes} episodes（缓存命中 {len(alive) - len(pending)}）")
+            for i in ranked:
+                print(f"  {keys[i]}  score={results[i]['score']:>10.4f}  {configs[i]}")
+            if rung + 1 < len(budgets):
+                alive = ranked[:max(1, math.ceil(len(alive) / args.eta))]
+
+    best = max(alive, key=lambda i: results[i]['score'])
+    return {
+        'best': {'key': keys[best], 'config': configs[best], 'score': results[best]['score']},
+        'budgets': budgets,
+        'trials': [{'key': keys[i], 'config': configs[i], 'episodes': results[i]['episodes'],
+                    'score': results[i]['score']} for i in range(len(configs)) if i in results],
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='超参数搜索')
+    parser.add_argument('--space', type=str, default=None, help='搜索空间 JSON 文件（默认 DEFAULT_SPACE）')
+    parser.add_argument('--mode', type=str, default='grid', choices=['grid', 'random'], help='搜索方式')
+    parser.add_argument('--samples', type=int, default=16, help='随机搜索的配置数')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='并行试验进程数')
+    parser.add_argument('--threads', type=int, default=1, help='每个试验的 torch 线程数')
+    parser.add_argument('--min_episodes', type=int, default=5, help='第一轮的 episode 预算')
+    parser.add_argument('--max_episodes', type=int, default=45, help='最后一轮的 episode 预算')
+    parser.add_argument('--eta', type=int, default=3, help='逐次减半的淘汰比例（每轮保留 1/eta）')
+    parser.add_argument('--max_steps', type=int, default=200, help='每个 episode 的步数')
+    parser.add_argument('--score_window', type=int, default=5, help='得分取最近多少个 episode 的平均')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子（同时参与缓存键）')
+    parser.add_argument('--cache', type=str, default='sweep_cache', help='结果缓存目录')
+    parser.add_argument('--output', type=str, default=None, help='结果 JSON 路径')
+    return parser.parse_args()
+
+
+def main(args):
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    configs = grid_configs(space) if args.mode == 'grid' else random_configs(space, args.samples, args.seed)
+    print(f"{len(configs)} 个配置 | workers={args.workers} | threads/trial={args.threads} | "
+          f"预算 {rung_budgets(args.min_episodes, args.max_episodes, args.eta)}")
+    report = run_sweep(configs, args)
+    print(f"\n最佳配置 {report['best']['key']}: {report['best']['config']} score={report['best']['score']:.4f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"结果已写入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
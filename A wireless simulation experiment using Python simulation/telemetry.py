@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: telemetry.py
+@time: 21/6/2025 上午 11:05
+@functions：训练遥测，按阶段记录纳秒级耗时，固定内存的直方图汇总，每 N 个 episode 写出一行 JSONL/CSV
+
+用法：
+    telemetry = Telemetry('telemetry.jsonl', every=10)   # 后缀 .csv 时写 CSV
+    agent.telemetry = telemetry
+    with telemetry.phase('env_step'):
+        env.step(action)
+    telemetry.end_episode(episode, reward)
+
+未启用时使用 NULL_TELEMETRY：phase() 返回共享的空计时器，scalar() 直接返回，开销只有一次方法调用。
+"""
+import csv
+import json
+import time
+
+# DDPGAgent 与训练循环记录的阶段，输出中总是包含这些列
+PHASES = ('select_action', 'env_step', 'replay_push', 'replay_sample', 'critic_forward', 'critic_backward',
+          'actor_forward', 'actor_backward', 'soft_update')
+SCALARS = ('critic_loss', 'actor_loss')
+
+
+class Histogram:
+    """
+    纳秒耗时的对数直方图，内存固定
+
+    每个 2 的幂区间再均分为 4 个桶（相对误差 < 25%），共 260 个计数器，覆盖 0 ~ 2^64 ns。
+    """
+
+    NUM_BUCKETS = 4 * 65
+
+    def __init__(self):
+        self.counts = [0] * self.NUM_BUCKETS
+        self.reset()
+
+    def reset(self):
+        for i in range(self.NUM_BUCKETS):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def bucket(ns):
+        bits = ns.bit_length()
+        if bits < 3:
+            return ns
+        return (bits << 2) + ((ns >> (bits - 3)) & 3)
+
+    @staticmethod
+    def bucket_bounds(index):
+        """桶 index 覆盖的 [下界, 上界) 纳秒"""
+        if index < 4:
+            return index, index + 1
+        bits, sub = index >> 2, index & 3
+        return (4 + sub) << (bits - 3), (5 + sub) << (bits - 3)
+
+    def record(self, ns):
+        self.counts[self.bucket(ns)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def quantile(self, q):
+        """分位数估计（所在桶的中点）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                low, high = self.bucket_bounds(index)
+                return min((low + high) / 2, self.max)
+        return float(self.max)
+
+    def summary(self):
+        """耗时统计（微秒）"""
+        return {
+            'count': self.count,
+            'total_ms': self.total / 1e6,
+            'mean_us': self.total / self.count / 1e3 if self.count else 0.0,
+            'p50_us': self.quantile(0.5) / 1e3,
+            'p99_us': self.quantile(0.99) / 1e3,
+            'max_us': self.max / 1e3,
+        }
+
+
+class _PhaseTimer:
+    """可复用的计时上下文，每个阶段一个，进入/退出时不分配对象"""
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter_ns() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Telemetry:
+    """
+    训练遥测
+
+    参数：
+        path : 输出文件，.csv 后缀写 CSV（列在第一次写出时确定），否则写 JSONL；None 时不写文件
+        every : 每隔多少个 episode 写出一行并清空直方图（每行统计的是这 every 个 episode 的窗口）
+    """
+
+    enabled = True
+
+    def __init__(self, path=None, every=10):
+        self.path = path
+        self.every = every
+        self.histograms = {name: Histogram() for name in PHASES}
+        self._timers = {name: _PhaseTimer(hist) for name, hist in self.histograms.items()}
+        self._scalars = {name: [0.0, 0] for name in SCALARS}  # 名称 -> [总和, 次数]
+        self._rewards = []
+        self._window_start = time.perf_counter_ns()
+        self._file = open(path, 'w', newline='') if path else None
+        self._csv = None
+        self.last_row = None  # 最近一次写出的行，不写文件时也可以直接读取
+
+    def phase(self, name):
+        """with telemetry.phase('env_step'): ... 记录该段代码的耗时"""
+        timer = self._timers.get(name)
+        if timer is None:
+            self.histograms[name] = Histogram()
+            timer = self._timers[name] = _PhaseTimer(self.histograms[name])
+        return timer
+
+    def record(self, name, ns):
+        """直接记录一次耗时（纳秒）"""
+        self.phase(name).histogram.record(ns)
+
+    def scalar(self, name, value):
+        """累计标量（如损失），输出窗口内的均值；value 可以是单元素张量"""
+        entry = self._scalars.get(name)
+        if entry is None:
+            entry = self._scalars[name] = [0.0, 0]
+        if hasattr(value, 'detach'):
+            value = value.detach()
+        entry[0] += float(value)
+        entry[1] += 1
+
+    def end_episode(self, episode, reward):
+        """episode 结束时调用，每 every 个 episode 写出一行"""
+        self._rewards.append(float(reward))
+        if (episode + 1) % self.every == 0:
+            self.flush(episode)
+
+    def flush(self, episode):
+        now = time.perf_counter_ns()
+        row = {
+            'episode': episode,
+            'episodes': len(self._rewards),
+            'wall_s': (now - self._window_start) / 1e9,
+            'reward_mean': sum(self._rewards) / len(self._rewards) if self._rewards else 0.0,
+        }
+        for name, entry in self._scalars.items():
+            row[name] = entry[0] / entry[1] if entry[1] else None  # 窗口内没有更新
+            entry[0], entry[1] = 0.0, 0
+        for name, histogram in self.histograms.items():
+            for stat, value in histogram.summary().items():
+                row[f'{name}.{stat}'] = value
+            histogram.reset()
+        self._rewards.clear()
+        self._window_start = now
+        self.last_row = row
+        self._write(row)
+        return row
+
+    def _write(self, row):
+        if self._file is None:
+            return
+        if self.path.endswith('.csv'):
+            if self._csv is None:
+                self._csv = csv.DictWriter(self._file, fieldnames=list(row), extrasaction='ignore')
+                self._csv.writeheader()
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(row) + '\n')
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class NullTelemetry:
+    """禁用的遥测：所有方法都是空操作"""
+
+    enabled = False
+
+    def phase(self, name):
+        return _NULL_TIMER
+
+    def record(self, name, ns):
+        pass
+
+    def scalar(self, name, value):
+        pass
+
+    def end_episode(self, episode, reward):
+        pass
+
+    def flush(self, episode):
+        return None
+
+    def close(self):
+        pass
+
+
+NULL_TELEMETRY = NullTelemetry()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: channel_trace.py
+@time: 10/6/2025 下午 4:05
+@functions：信道轨迹的录制与回放（float32 分块写入，np.memmap 零拷贝读取）
+"""
+import json
+import os
+
+import numpy as np
+
+TRACE_VERSION = 1
+
+# 每个时隙记录的字段，均按 max_users 填充；num_users 单独占一列
+# positions 为计算路径损耗所用的用户距离（开启移动模型时可能滞后于真实位置）
+TRACE_FIELDS = ('positions', 'qos_demand', 'load', 'interference', 'shadowing', 'fading', 'base_delay')
+
+
+class TraceWriter:
+    """
+    轨迹录制
+
+    目录结构：
+        meta.json      - 版本、max_users、时隙数、字段宽度
+        <field>.f32    - 每个字段一个文件，形状 (num_frames, width) 的 float32 行优先数组
+    数据先写入内存中的 chunk_frames 行缓冲区，写满后整体追加到文件末尾。
+    """
+
+    def __init__(self, path, max_users, chunk_frames=1024):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_users = max_users
+        self.chunk_frames = chunk_frames
+        self.widths = {'num_users': 1}
+        self.widths.update({name: max_users for name in TRACE_FIELDS})
+
+        self._chunk = {name: np.zeros((chunk_frames, width), dtype=np.float32)
+                       for name, width in self.widths.items()}
+        self._files = {name: open(os.path.join(path, f'{name}.f32'), 'wb') for name in self.widths}
+        self._rows = 0  # 缓冲区中的行数
+        self.num_frames = 0
+
+    def append(self, num_users, **fields):
+        """追加一个时隙，fields 中每个数组长度为 num_users"""
+        row = self._rows
+        self._chunk['num_users'][row, 0] = num_users
+        for name in TRACE_FIELDS:
+            buf = self._chunk[name][row]
+            buf[:num_users] = fields[name]
+            buf[num_users:] = 0
+        self._rows += 1
+        self.num_frames += 1
+        if self._rows == self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            for name, f in self._files.items():
+                self._chunk[name][:self._rows].tofile(f)
+                f.flush()
+            self._rows = 0
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            'version': TRACE_VERSION,
+            'max_users': self.max_users,
+            'num_frames': self.num_frames,
+            'chunk_frames': self.chunk_frames,
+            'dtype': 'float32',
+            'fields': self.widths,
+        }
+        tmp = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, 'meta.json'))
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+
+class TraceReader:
+    """轨迹回放：每个字段映射为只读 np.memmap，frame 返回的是行视图，不发生拷贝"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['version'] != TRACE_VERSION:
+            raise ValueError(f"不支持的轨迹版本: {meta['version']}")
+        if meta['num_frames'] == 0:
+            raise ValueError(f"轨迹为空: {path}")
+        self.path = path
+        self.max_users = meta['max_users']
+        self.num_frames = meta['num_frames']
+        self.fields = {
+            name: np.memmap(os.path.join(path, f'{name}.f32'), dtype=np.float32, mode='r',
+                            shape=(self.num_frames, width))
+            for name, width in meta['fields'].items()
+        }
+
+    def __len__(self):
+        return self.num_frames
+
+    def frame(self, index):
+        """第 index 个时隙的数据（越界时循环回放）"""
+        index %= self.num_frames
+        num_users = int(self.fields['num_users'][index, 0])
+        frame = {name: self.fields[name][index, :num_users] for name in TRACE_FIELDS}
+        frame['num_users'] = num_users
+        return frame
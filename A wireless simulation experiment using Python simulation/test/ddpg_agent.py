@@ -1,34 +1,16 @@
+import os
+import sys
+
 import torch
 import torch.nn as nn
 import torch.optim as optim
 import torch.nn.functional as F
 import numpy as np
 
-
-class ReplayBuffer:
-    def __init__(self, capacity):
-        self.capacity = capacity
-        self.buffer = []
-        self.position = 0
-
-    def push(self, state, action, reward, next_state):
-        if len(self.buffer) < self.capacity:
-            self.buffer.append(None)
-        self.buffer[self.position] = (state, action, reward, next_state)
-        self.position = (self.position + 1) % self.capacity
-
-    def sample(self, batch_size):
-        indices = np.random.choice(len(self.buffer), batch_size, replace=False)
-        states, actions, rewards, next_states = zip(*[self.buffer[i] for i in indices])
-        return (
-            np.array(states),
-            np.array(actions),
-            np.array(rewards),
-            np.array(next_states)
-        )
-
-    def __len__(self):
-        return len(self.buffer)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 共享模块位于上级目录
+from cpu_profile import NULL_PROFILE, StateActionLinear
+from replay import make_replay_buffer
+from telemetry import NULL_TELEMETRY
 
 
 class Actor(nn.Module):
@@ -53,7 +35,7 @@ class Critic(nn.Module):
     def __init__(self, state_dim, action_dim):
         super(Critic, self).__init__()
         self.net = nn.Sequential(
-            nn.Linear(state_dim + action_dim, 256),
+            StateActionLinear(state_dim, action_dim, 256),  # 首层按状态/动作拆分，省去输入拼接
             nn.LeakyReLU(0.01),
             nn.Linear(256, 128),  # 保持与训练时相同的层级结构
             nn.LeakyReLU(0.01),
@@ -61,19 +43,137 @@ class Critic(nn.Module):
         )
 
     def forward(self, state, action):
-        return self.net(torch.cat([state, action], dim=1))  # 修正dim参数
+        return self.net((state, action))
+
+
+def split_users(state):
+    """
+    把观测整理成逐用户特征和有效用户掩码
+
+    集合网络要求环境使用 obs_layout='per_user'：扁平布局按 n 分段，段的位置无法可靠地从数值推断。
+
+    参数：
+        state : (batch, max_users, 4) 的逐用户观测，或其按行展平的 (batch, 4*max_users)（回放缓冲区中的存储形式），
+                无效用户行为0
+    返回：
+        users : (batch, max_users, 4)
+        mask : (batch, max_users) 有效用户掩码
+        num_users : (batch,) 每个样本的有效用户数 n
+    """
+    users = state.reshape(state.shape[0], -1, 4)
+    mask = users[..., 1] > 0  # 有效用户的 QoS 特征为 需求/5 >= 0.2，填充行为0
+    return users, mask, mask.sum(dim=1)
+
+
+def masked_pool(features, batch_idx, batch_size: int):  # 注解 int 供 TorchScript 推断类型
+    """对每个样本的有效用户特征做 sum/max 池化，返回 (sum, max, count)"""
+    dim = features.shape[1]
+    total = features.new_zeros(batch_size, dim).index_add_(0, batch_idx, features)
+    peak = features.new_zeros(batch_size, dim).scatter_reduce_(
+        0, batch_idx.unsqueeze(1).expand(-1, dim), features, reduce='amax', include_self=False)
+    count = torch.bincount(batch_idx, minlength=batch_size).to(features.dtype).unsqueeze(1)
+    return total, peak, count
+
+
+class SetActor(nn.Module):
+    """
+    基于集合的Actor：所有用户共享同一个编码器，只处理有效用户，
+    每个用户的动作由自身编码和全小区平均编码共同决定，与 max_users 无关
+    """
+
+    def __init__(self, state_dim=None, action_dim=None, hidden_dim=64):
+        super(SetActor, self).__init__()
+        # state_dim/action_dim 仅为与 Actor 接口一致，网络尺寸不依赖用户数
+        self.encoder = nn.Sequential(
+            nn.Linear(4, hidden_dim),
+            nn.ReLU(),
+            nn.Linear(hidden_dim, hidden_dim),
+            nn.ReLU()
+        )
+        # head(cat[编码, 上下文]) 拆成两个线性层：上下文部分按样本计算一次再广播到用户
+        self.user_proj = nn.Linear(hidden_dim, hidden_dim)
+        self.context_proj = nn.Linear(hidden_dim, hidden_dim, bias=False)
+        self.head = nn.Sequential(
+            nn.ReLU(),
+            nn.Linear(hidden_dim, 2),
+            nn.Sigmoid()
+        )
+
+    def forward(self, state):
+        users, mask, num_users = split_users(state)
+        batch, max_users, _ = users.shape
+        batch_idx, user_idx = mask.nonzero().unbind(1)  # 不用 as_tuple，保持 TorchScript 可编译
+
+        encoded = self.encoder(users[batch_idx, user_idx])  # (有效用户总数, hidden)
+        total, _, count = masked_pool(encoded, batch_idx, batch)
+        context = self.context_proj(total / count.clamp(min=1))  # (batch, hidden)
+        per_user = self.head(self.user_proj(encoded) + context[batch_idx])  # (有效用户总数, 2)
+
+        # 按环境的动作布局 [RB(n), 功率(n), 0...] 填回，无效用户动作为0
+        flat = batch_idx * (2 * max_users) + user_idx
+        power_flat = flat + num_users[batch_idx]
+        actions = per_user.new_zeros(batch * 2 * max_users)
+        actions = actions.index_put((torch.cat([flat, power_flat]),),
+                                    torch.cat([per_user[:, 0], per_user[:, 1]]))
+        return actions.view(batch, 2 * max_users)
+
+
+class SetCritic(nn.Module):
+    """基于集合的Critic：逐用户编码 [观测, 动作]，池化后输出Q值"""
+
+    def __init__(self, state_dim=None, action_dim=None, hidden_dim=64):
+        super(SetCritic, self).__init__()
+        self.encoder = nn.Sequential(
+            nn.Linear(4 + 2, hidden_dim),
+            nn.LeakyReLU(0.01),
+            nn.Linear(hidden_dim, hidden_dim),
+            nn.LeakyReLU(0.01)
+        )
+        self.head = nn.Sequential(
+            nn.Linear(2 * hidden_dim + 1, hidden_dim),
+            nn.LeakyReLU(0.01),
+            nn.Linear(hidden_dim, 1)
+        )
+
+    def forward(self, state, action):
+        users, mask, num_users = split_users(state)
+        batch = users.shape[0]
+        batch_idx, user_idx = mask.nonzero().unbind(1)  # 不用 as_tuple，保持 TorchScript 可编译
+
+        rb = action[batch_idx, user_idx]
+        power = action[batch_idx, num_users[batch_idx] + user_idx]
+        features = torch.cat([users[batch_idx, user_idx], rb.unsqueeze(1), power.unsqueeze(1)], dim=1)
+        encoded = self.encoder(features)
+        total, peak, count = masked_pool(encoded, batch_idx, batch)
+        # 奖励是各用户项之和，池化保留均值、最大值和用户数
+        return self.head(torch.cat([total / count.clamp(min=1), peak, torch.log1p(count)], dim=1))
+
+
+NETWORKS = {
+    'mlp': (Actor, Critic),  # 固定 max_users 的全连接网络
+    'set': (SetActor, SetCritic),  # 只处理有效用户的集合网络
+}
+# 各网络要求的环境观测布局（WirelessCommEnv 的 obs_layout）
+OBS_LAYOUTS = {
+    'mlp': 'flat',
+    'set': 'per_user',
+}
 
 
 class DDPGAgent:
-    def __init__(self, state_dim, action_dim, gamma=0.99, tau=0.005):
+    def __init__(self, state_dim, action_dim, gamma=0.99, tau=0.005, network='mlp', prioritized=False,
+                 replay_path=None, policy_delay=1, target_update_every=1, cpu_profile=None,
+                 replay_resume=False):
         # 设备配置（修正拼写错误）
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
         # 初始化网络
-        self.actor = Actor(state_dim, action_dim).to(self.device)
-        self.critic = Critic(state_dim, action_dim).to(self.device)
-        self.target_actor = Actor(state_dim, action_dim).to(self.device)
-        self.target_critic = Critic(state_dim, action_dim).to(self.device)
+        actor_cls, critic_cls = NETWORKS[network]
+        self.obs_layout = OBS_LAYOUTS[network]  # 环境需使用该观测布局
+        self.actor = actor_cls(state_dim, action_dim).to(self.device)
+        self.critic = critic_cls(state_dim, action_dim).to(self.device)
+        self.target_actor = actor_cls(state_dim, action_dim).to(self.device)
+        self.target_critic = critic_cls(state_dim, action_dim).to(self.device)
 
         # 同步目标网络参数
         self.target_actor.load_state_dict(self.actor.state_dict())
@@ -83,57 +183,133 @@ class DDPGAgent:
         self.actor_optimizer = optim.Adam(self.actor.parameters(), lr=1e-4)
         self.critic_optimizer = optim.Adam(self.critic.parameters(), lr=1e-3)
 
-        # 经验回放
-        self.replay_buffer = ReplayBuffer(capacity=1000000)
+        # 经验回放（prioritized=True 时为基于求和树的优先经验回放，replay_path 给定时存放在磁盘 memmap 中，
+        # replay_resume=True 时接着使用其中已有的经验）
+        self.prioritized = prioritized
+        self.replay_buffer = make_replay_buffer(1000000, state_dim, action_dim, prioritized, replay_path,
+                                                resume=replay_resume, device=self.device)
         self.batch_size = 128
         self.gamma = gamma
         self.tau = tau
+        # 每 policy_delay 次 critic 更新才更新一次 actor 和目标网络（TD3 式延迟策略更新）
+        self.policy_delay = policy_delay
+        self.target_update_every = target_update_every
+        self.num_updates = 0
+        self.telemetry = NULL_TELEMETRY  # 替换为 telemetry.Telemetry 时记录各阶段耗时与损失
+        # cpu_profile.CPUProfile：按批量大小设置线程数、可选 bfloat16 autocast（仅 CPU 上有意义）
+        self.cpu_profile = cpu_profile or NULL_PROFILE
+        # 软更新用的参数列表只构建一次
+        self._online_params = list(self.actor.parameters()) + list(self.critic.parameters())
+        self._target_params = list(self.target_actor.parameters()) + list(self.target_critic.parameters())
 
     def select_action(self, state, noise_scale=0.1):
-        state = torch.FloatTensor(state).unsqueeze(0).to(self.device)
-        with torch.no_grad():
-            action = self.actor(state).cpu().numpy()[0]
-        noise = noise_scale * np.random.randn(*action.shape)
-        return np.clip(action + noise, 0, 1)
+        return self.select_actions(np.asarray(state)[None], noise_scale)[0]
+
+    def select_actions(self, states, noise_scale=0.1, noise=None):
+        """
+        批量选择动作
 
-    def save_experience(self, state, action, reward, next_state):
-        self.replay_buffer.push(state, action, reward, next_state)
+        参数：
+            states : (N, state_dim) 状态矩阵
+            noise : 噪声过程（exploration.OUNoise 等，需与 agent 在同一设备），None 时为 noise_scale 倍的高斯噪声
+        返回：
+            (N, action_dim) 的连续 float32 数组
+        """
+        # float32 观测通过 from_numpy 共享内存，不再拷贝
+        states = torch.from_numpy(np.ascontiguousarray(states, dtype=np.float32)).to(self.device)
+        with torch.inference_mode(), self.cpu_profile.context(len(states)):
+            actions = self.actor(states).float()
+            # 噪声直接在设备上一次生成
+            if noise is not None:
+                actions += noise.sample()
+            elif noise_scale:
+                actions += noise_scale * torch.randn_like(actions)
+            return actions.clamp_(0, 1).cpu().numpy()
 
-    def update(self):
+    def save_experience(self, state, action, reward, next_state, done=False):
+        self.replay_buffer.push(state, action, reward, next_state, done)
+
+    def update(self, num_updates=1):
+        """
+        num_updates 次梯度更新：一次采样 num_updates * batch_size 条经验，再切成 num_updates 个小批量依次更新
+        """
         if len(self.replay_buffer) < self.batch_size:
             return
 
         # 从回放缓冲区采样
-        states, actions, rewards, next_states = self.replay_buffer.sample(self.batch_size)
-        states = torch.FloatTensor(states).to(self.device)
-        actions = torch.FloatTensor(actions).to(self.device)
-        rewards = torch.FloatTensor(rewards).unsqueeze(1).to(self.device)
-        next_states = torch.FloatTensor(next_states).to(self.device)
+        with self.telemetry.phase('replay_sample'):
+            batch = self.replay_buffer.sample(num_updates * self.batch_size)
+        micro_batches = zip(*(tensor.split(self.batch_size) for tensor in batch[:5]))
+        with self.cpu_profile.threads(self.batch_size):
+            for i, (states, actions, rewards, next_states, dones) in enumerate(micro_batches):
+                weights = indices = None
+                if self.prioritized:
+                    weights = batch[5].split(self.batch_size)[i]
+                    indices = batch[6][i * self.batch_size:(i + 1) * self.batch_size]
+                self._update_step(states, actions, rewards, next_states, dones, weights, indices)
 
-        # 更新Critic网络
-        with torch.no_grad():
-            target_actions = self.target_actor(next_states)
-            target_q = self.target_critic(next_states, target_actions)
-            target_q = rewards + self.gamma * target_q
+    def _update_step(self, states, actions, rewards, next_states, dones, weights=None, indices=None):
+        telemetry = self.telemetry
+        # 更新Critic网络（bfloat16 autocast 只包住网络前向，输出为 bf16，目标与损失统一在 float32 下计算）
+        with telemetry.phase('critic_forward'), self.cpu_profile.autocast():
+            with torch.no_grad():
+                target_actions = self.target_actor(next_states)
+                target_q = self.target_critic(next_states, target_actions).float()
+                target_q = rewards + self.gamma * (1 - dones) * target_q
 
-        current_q = self.critic(states, actions)
-        critic_loss = F.mse_loss(current_q, target_q)
+            current_q = self.critic(states, actions).float()
+            td_error = target_q - current_q
+            if weights is None:
+                critic_loss = F.mse_loss(current_q, target_q)
+            else:
+                critic_loss = (weights * td_error.pow(2)).mean()  # 重要性采样权重修正优先采样带来的偏差
 
-        self.critic_optimizer.zero_grad()
-        critic_loss.backward()
-        self.critic_optimizer.step()
+        with telemetry.phase('critic_backward'):
+            self.critic_optimizer.zero_grad()
+            critic_loss.backward()
+            self.critic_optimizer.step()
+        telemetry.scalar('critic_loss', critic_loss)
+        if indices is not None:
+            self.replay_buffer.update_priorities(indices, td_error.detach().cpu().numpy())
+
+        self.num_updates += 1
+        if self.num_updates % self.policy_delay:
+            return
 
         # 更新Actor网络
-        actor_actions = self.actor(states)
-        actor_loss = -self.critic(states, actor_actions).mean()
+        with telemetry.phase('actor_forward'), self.cpu_profile.autocast():
+            actor_actions = self.actor(states)
+            actor_loss = -self.critic(states, actor_actions).mean()
+
+        with telemetry.phase('actor_backward'):
+            self.actor_optimizer.zero_grad()
+            actor_loss.backward()
+            self.actor_optimizer.step()
+        telemetry.scalar('actor_loss', actor_loss)
 
-        self.actor_optimizer.zero_grad()
-        actor_loss.backward()
-        self.actor_optimizer.step()
+        # 软更新目标网络（每 target_update_every 次 actor 更新一次）
+        if (self.num_updates // self.policy_delay) % self.target_update_every == 0:
+            with telemetry.phase('soft_update'):
+                self.soft_update()
 
-        # 软更新目标网络
-        for target_param, param in zip(self.target_actor.parameters(), self.actor.parameters()):
-            target_param.data.copy_(self.tau * param.data + (1 - self.tau) * target_param.data)
+    def state_dict(self):
+        """网络、目标网络、优化器和更新计数（不含回放缓冲区）"""
+        return {
+            'actor': self.actor.state_dict(),
+            'critic': self.critic.state_dict(),
+            'target_actor': self.target_actor.state_dict(),
+            'target_critic': self.target_critic.state_dict(),
+            'actor_optimizer': self.actor_optimizer.state_dict(),
+            'critic_optimizer': self.critic_optimizer.state_dict(),
+            'num_updates': self.num_updates,
+        }
 
-        for target_param, param in zip(self.target_critic.parameters(), self.critic.parameters()):
-            target_param.data.copy_(self.tau * param.data + (1 - self.tau) * target_param.data)
\ No newline at end of file
+    def load_state_dict(self, state):
+        for name in ('actor', 'critic', 'target_actor', 'target_critic', 'actor_optimizer', 'critic_optimizer'):
+            getattr(self, name).load_state_dict(state[name])
+        self.num_updates = state['num_updates']
+
+    def soft_update(self):
+        """target <- target + tau * (online - target)，actor 与 critic 的全部参数用一次 foreach 原地完成"""
+        with torch.no_grad():
+            torch._foreach_lerp_(self._target_params, self._online_params, self.tau)
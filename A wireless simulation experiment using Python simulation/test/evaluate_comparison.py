@@ -11,12 +11,15 @@
 # !/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import argparse
+import time
+
 import numpy as np
 import torch
 import matplotlib.pyplot as plt
-from ddpg_agent import DDPGAgent
+from ddpg_agent import OBS_LAYOUTS, DDPGAgent
 from wireless_env import WirelessCommEnv
 from traditional import TraditionalScheduler
+from parallel_eval import episode_metrics, evaluate_parallel
 
 
 def parse_args():
@@ -33,11 +36,27 @@ def parse_args():
     parser.add_argument('--trad_mode', type=str, default='channel_aware',
                         choices=['round_robin', 'equal_power', 'channel_aware'],
                         help='传统算法模式')
+    parser.add_argument('--trace', type=str, default=None,
+                        help='回放已录制的信道轨迹目录，所有算法使用相同的信道序列')
+    parser.add_argument('--record_trace', type=str, default=None,
+                        help='评估RL算法时录制信道轨迹到该目录，随后传统算法回放同一轨迹')
+    parser.add_argument('--network', type=str, default='mlp', choices=['mlp', 'set'],
+                        help='Actor/Critic 网络结构（需与训练一致）')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='并行评估进程数（默认CPU核数，0 表示在当前进程内执行）')
+    parser.add_argument('--batch_episodes', type=int, default=8,
+                        help='每个进程同时推进的轮数（策略推理的批量）')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='每个评估进程的torch线程数')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='场景种子，各算法在同一轮使用相同的场景')
     return parser.parse_args()
 
 
 def run_evaluation(agent, env, args, is_rl=True):
-    """执行评估流程"""
+    """
+    单进程逐轮评估（录制信道轨迹时使用）；环境需开启 metrics_capacity，逐步指标写入 env.metrics，每轮结束后统一统计
+    """
     metrics = {
         'throughput': [],
         'delay': [],
@@ -47,10 +66,9 @@ def run_evaluation(agent, env, args, is_rl=True):
         'power_usage': []
     }
 
-    for ep in range(args.episodes):
-        state = env.reset()
-        current_users = env.current_num_users
-        ep_metrics = {k: [] for k in metrics.keys()}
+    for _ in range(args.episodes):
+        state, _ = env.reset()
+        env.metrics.clear()
 
         for _ in range(args.max_steps):
             # 选择动作
@@ -59,34 +77,13 @@ def run_evaluation(agent, env, args, is_rl=True):
             else:
                 action = agent.allocate(state)
 
-            # 与环境交互
-            next_state, reward, done, info = env.step(action)
-
-            # 收集指标（确保转换为标量）
-            ep_metrics['throughput'].append(float(np.sum(info['throughput'])))
-            ep_metrics['delay'].append(float(np.mean(info['delay'])))
-            ep_metrics['packet_loss'].append(float(np.mean(info['packet_loss'])))
-            ep_metrics['power_usage'].append(float(np.mean(info['power'])))
-
-            # 计算能效和公平性
-            valid_users = current_users
-            throughputs = np.array(info['throughput'][:valid_users])
-            powers = np.array(info['power'][:valid_users])
-            ee = np.sum(throughputs) / (np.sum(powers) + 1e-6)
-            sum_throughput = np.sum(throughputs)
-            fairness = (sum_throughput ** 2) / (valid_users * np.sum(throughputs ** 2)) if sum_throughput != 0 else 0
-
-            ep_metrics['energy_efficiency'].append(float(ee))
-            ep_metrics['fairness'].append(float(fairness))
-
-            state = next_state
+            # 与环境交互（指标由环境直接写入环形缓冲区）
+            state, _, _, _, _ = env.step(action)
 
         # 记录统计量
+        ep_metrics = episode_metrics(env.metrics.window(args.max_steps))
         for k in metrics.keys():
-            metrics[k].append(np.mean(ep_metrics[k]))
-
-        print(f"Ep {ep + 1}/{args.episodes} {'(RL)' if is_rl else '(Trad)'} "
-              f"| Users: {current_users} | Tput: {np.mean(ep_metrics['throughput']):.1f}Mbps")
+            metrics[k].append(ep_metrics[k])
 
     return metrics
 
@@ -167,14 +164,18 @@ def plot_comparison(report, args):
     plt.close()
 
 
-def main(args):
-    # 初始化环境
-    env = WirelessCommEnv(max_users=args.max_users)
+def run_serial(args):
+    """录制信道轨迹：RL 算法逐轮评估并写入轨迹，传统算法随后回放同一轨迹"""
+    # 初始化环境：RL 使用网络要求的观测布局，传统算法按扁平布局读取 CSI，回放同一轨迹
+    env = WirelessCommEnv(max_users=args.max_users, metrics_capacity=args.max_steps, seed=args.seed,
+                          obs_layout=OBS_LAYOUTS[args.network])
+    trad_env = WirelessCommEnv(max_users=args.max_users, metrics_capacity=args.max_steps)
 
     # 加载RL智能体
     rl_agent = DDPGAgent(
         state_dim=4 * args.max_users,
-        action_dim=2 * args.max_users
+        action_dim=2 * args.max_users,
+        network=args.network
     )
     rl_agent.actor.load_state_dict(torch.load(args.model_path, map_location='cpu'))
     rl_agent.actor.eval()
@@ -186,11 +187,32 @@ def main(args):
     )
 
     # 评估流程
+    env.start_recording(args.record_trace)
     print("\n=== 评估强化学习算法 ===")
     rl_metrics = run_evaluation(rl_agent, env, args, is_rl=True)
 
+    env.stop_recording()
+    trad_env.load_trace(args.record_trace)
     print("\n=== 评估传统算法 ===")
-    trad_metrics = run_evaluation(trad_agent, env, args, is_rl=False)
+    trad_metrics = run_evaluation(trad_agent, trad_env, args, is_rl=False)
+    return rl_metrics, trad_metrics
+
+
+def main(args):
+    start = time.perf_counter()
+    if args.record_trace and not args.trace:
+        rl_metrics, trad_metrics = run_serial(args)
+    else:
+        # 并行评估：各轮分块分发到进程池，RL 与传统算法在同一组带种子的场景（或同一轨迹）上评估
+        policies = {
+            'rl': {'kind': 'rl', 'model_path': args.model_path, 'network': args.network},
+            'trad': {'kind': 'traditional', 'mode': args.trad_mode},
+        }
+        metrics = evaluate_parallel(policies, args.episodes, args.max_steps, args.max_users, workers=args.workers,
+                                    batch_episodes=args.batch_episodes, threads=args.threads, seed=args.seed,
+                                    trace=args.trace)
+        rl_metrics, trad_metrics = metrics['rl'], metrics['trad']
+    print(f"\n评估完成：{args.episodes} 轮 × 2 个算法，用时 {time.perf_counter() - start:.1f}s")
 
     # 生成报告
     report = generate_report(rl_metrics, trad_metrics)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: mobility.py
+@time: 5/6/2025 下午 3:20
+@functions：用户移动模型，按时隙增量更新用户位置（全部向量化）
+"""
+import numpy as np
+
+
+class MobilityModel:
+    """
+    移动模型基类
+
+    用户在以基站为原点的二维平面上移动，活动区域为 [min_distance, max_distance] 的圆环，
+    step 返回每个用户到基站的距离，供环境计算路径损耗。
+    """
+
+    def __init__(self, min_distance=50, max_distance=500, rng=np.random):
+        self.min_distance = min_distance
+        self.max_distance = max_distance
+        self.rng = rng  # np.random 模块或 np.random.Generator
+        self.xy = np.zeros((0, 2))
+
+    def reset(self, distances):
+        """以给定距离和随机方位角初始化用户坐标"""
+        angle = self.rng.uniform(0, 2 * np.pi, len(distances))
+        self.xy = np.stack([distances * np.cos(angle), distances * np.sin(angle)], axis=1)
+        self._reset_state(len(distances))
+        return self.distances
+
+    def _reset_state(self, num_users):
+        raise NotImplementedError
+
+    def step(self, dt=1.0):
+        """推进 dt 秒，返回新的用户距离"""
+        raise NotImplementedError
+
+    @property
+    def distances(self):
+        return np.clip(np.hypot(self.xy[:, 0], self.xy[:, 1]), self.min_distance, self.max_distance)
+
+    def _sample_points(self, count):
+        """在活动圆环内按面积均匀采样"""
+        r = np.sqrt(self.rng.uniform(self.min_distance ** 2, self.max_distance ** 2, count))
+        angle = self.rng.uniform(0, 2 * np.pi, count)
+        return np.stack([r * np.cos(angle), r * np.sin(angle)], axis=1)
+
+
+class RandomWaypoint(MobilityModel):
+    """随机路点模型：匀速走向随机目标点，到达后停留一段时间再选择下一个目标"""
+
+    def __init__(self, min_speed=0.5, max_speed=15.0, max_pause=2.0, **kwargs):
+        super(RandomWaypoint, self).__init__(**kwargs)
+        self.min_speed = min_speed  # m/s
+        self.max_speed = max_speed  # m/s
+        self.max_pause = max_pause  # s
+
+    def _reset_state(self, num_users):
+        self.waypoints = self._sample_points(num_users)
+        self.speed = self.rng.uniform(self.min_speed, self.max_speed, num_users)
+        self.pause = np.zeros(num_users)
+
+    def step(self, dt=1.0):
+        moving = self.pause <= 0
+        self.pause = np.maximum(self.pause - dt, 0)
+
+        # 所有用户统一按比例前进，停留中的用户 travel 为0，避免布尔索引带来的拷贝
+        offset = self.waypoints - self.xy
+        remaining = np.hypot(offset[:, 0], offset[:, 1])
+        travel = self.speed * (dt * moving)
+        self.xy += offset * np.minimum(travel / np.maximum(remaining, 1e-9), 1.0)[:, None]
+
+        # 到达的用户停在路点，重新抽取停留时间、下一个路点和速度
+        arrived = moving & (remaining <= travel)
+        count = int(np.count_nonzero(arrived))
+        if count:
+            self.pause[arrived] = self.rng.uniform(0, self.max_pause, count)
+            self.waypoints[arrived] = self._sample_points(count)
+            self.speed[arrived] = self.rng.uniform(self.min_speed, self.max_speed, count)
+        return self.distances
+
+
+class GaussMarkov(MobilityModel):
+    """Gauss-Markov 模型：速度矢量为一阶自回归过程，alpha 控制记忆程度（直接在速度分量上迭代，无需三角函数）"""
+
+    def __init__(self, alpha=0.75, mean_speed=5.0, speed_std=1.0, **kwargs):
+        super(GaussMarkov, self).__init__(**kwargs)
+        self.alpha = alpha
+        self.mean_speed = mean_speed  # m/s
+        self.speed_std = speed_std  # 每个速度分量的随机扰动（m/s）
+
+    def _reset_state(self, num_users):
+        direction = self.rng.uniform(0, 2 * np.pi, num_users)
+        self.mean_velocity = self.mean_speed * np.stack([np.cos(direction), np.sin(direction)], axis=1)
+        self.velocity = self.mean_velocity.copy()
+
+    def step(self, dt=1.0):
+        a = self.alpha
+        self.velocity *= a
+        self.velocity += (1 - a) * self.mean_velocity
+        self.velocity += np.sqrt(1 - a ** 2) * self.rng.normal(0, self.speed_std, self.velocity.shape)
+        self.xy += self.velocity * dt
+
+        # 越过圆环边界的用户拉回边界并反向
+        r = np.hypot(self.xy[:, 0], self.xy[:, 1])
+        outside = (r < self.min_distance) | (r > self.max_distance)
+        if np.any(outside):
+            clipped = np.clip(r[outside], self.min_distance, self.max_distance)
+            self.xy[outside] *= (clipped / np.maximum(r[outside], 1e-9))[:, None]
+            self.velocity[outside] *= -1
+            self.mean_velocity[outside] *= -1
+        return self.distances
+
+
+MOBILITY_MODELS = {
+    'random_waypoint': RandomWaypoint,
+    'gauss_markov': GaussMarkov,
+}
+
+
+def make_mobility(name, **kwargs):
+    """按名称创建移动模型"""
+    if name not in MOBILITY_MODELS:
+        raise ValueError(f"未知的移动模型: {name}")
+    return MOBILITY_MODELS[name](**kwargs)
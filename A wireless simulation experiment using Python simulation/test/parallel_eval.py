@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: parallel_eval.py
+@time: 22/6/2025 下午 7:30
+@functions：并行多轮评估引擎，episode 分块分发到进程池，各算法在同一组带种子的场景上评估，块内多轮并发、策略批量推理
+
+每个 episode 的场景由 spawn_seeds(seed, episodes)[ep] 决定：环境的各随机数流与动作无关，
+因此不同算法在同一 episode 中看到完全相同的用户位置、信道和时延序列（回放轨迹时则从第 ep * max_steps 帧开始）。
+块内 batch_episodes 个环境同步推进，每个时隙把它们的观测拼成一个批量调用一次策略。
+
+用法：
+    policies = {'rl': {'kind': 'rl', 'model_path': 'ddpg_actor.pth', 'network': 'mlp'},
+                'trad': {'kind': 'traditional', 'mode': 'channel_aware'}}
+    metrics = evaluate_parallel(policies, episodes=100, max_steps=200, max_users=50, workers=4)
+    metrics['rl']['throughput']  # 按 episode 顺序的每轮均值
+"""
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from ddpg_agent import NETWORKS, OBS_LAYOUTS
+from traditional import TraditionalScheduler
+from wireless_env import WirelessCommEnv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 共享模块位于上级目录
+from kpi import reduce_kpis, user_mask
+from rng import spawn_seeds
+
+METRICS = ('throughput', 'delay', 'packet_loss', 'energy_efficiency', 'fairness', 'power_usage')
+
+
+def episode_metrics(window):
+    """
+    由环形缓冲区中一轮的逐时隙数据计算该轮各指标的均值
+
+    参数：
+        window : MetricsRing.window() 的返回值，各列形状 (steps, max_users)
+    """
+    mask = user_mask(window['num_users'], window['throughput'].shape[1])
+    kpis = reduce_kpis(window['throughput'], window['power'], mask=mask,
+                       delay=window['delay'], packet_loss=window['packet_loss'])  # 每个时隙一行
+    num_users = kpis['num_users']
+    return {
+        'throughput': np.mean(kpis['sum_throughput']),
+        'delay': np.mean(kpis['sum_delay'] / num_users),
+        'packet_loss': np.mean(kpis['sum_packet_loss'] / num_users),
+        'energy_efficiency': np.mean(kpis['energy_efficiency']),
+        'fairness': np.mean(kpis['jain']),
+        'power_usage': np.mean(kpis['sum_power'] / num_users)
+    }
+
+
+class ActorPolicy:
+    """只加载 actor 的 RL 策略，(N, state_dim) -> (N, action_dim)，无探索噪声"""
+
+    def __init__(self, model_path, max_users, network='mlp'):
+        self.obs_layout = OBS_LAYOUTS[network]
+        self.actor = NETWORKS[network][0](4 * max_users, 2 * max_users)
+        self.actor.load_state_dict(torch.load(model_path, map_location='cpu'))
+        self.actor.eval()
+
+    def __call__(self, states):
+        with torch.inference_mode():
+            return self.actor(torch.from_numpy(states)).clamp_(0, 1).numpy()
+
+
+class TraditionalPolicy:
+    """逐行调用 TraditionalScheduler.allocate 的批量接口"""
+
+    obs_layout = 'flat'  # 按扁平布局读取 CSI
+
+    def __init__(self, max_users, mode='channel_aware'):
+        self.scheduler = TraditionalScheduler(max_users=max_users, mode=mode)
+
+    def __call__(self, states):
+        return np.stack([self.scheduler.allocate(state) for state in states])
+
+
+def make_policy(spec, max_users):
+    """按描述创建策略：{'kind': 'rl', 'model_path', 'network'} 或 {'kind': 'traditional', 'mode'}"""
+    if spec['kind'] == 'rl':
+        return ActorPolicy(spec['model_path'], max_users, spec.get('network', 'mlp'))
+    if spec['kind'] == 'traditional':
+        return TraditionalPolicy(max_users, spec.get('mode', 'channel_aware'))
+    raise ValueError(f"未知的策略类型: {spec['kind']}")
+
+
+# 子进程内复用的策略与环境（同一进程会处理多个 episode 块）；workers=0 时在调用方进程内跨调用复用，
+# 因此按创建时用到的全部参数作为键，参数变化时重新创建
+_POLICIES = {}  # (名称, 策略描述, max_users) -> 策略
+_ENVS = {}  # (max_users, max_steps, trace, 观测布局) -> 环境列表
+
+
+def _worker_init(threads):
+    torch.set_num_threads(threads)
+
+
+def _get_policy(name, spec, max_users):
+    key = (name, tuple(sorted(spec.items())), max_users)
+    if key not in _POLICIES:
+        _POLICIES[key] = make_policy(spec, max_users)
+    return _POLICIES[key]
+
+
+def _get_envs(count, max_users, max_steps, trace, obs_layout):
+    envs = _ENVS.setdefault((max_users, max_steps, trace, obs_layout), [])
+    while len(envs) < count:
+        env = WirelessCommEnv(max_users=max_users, metrics_capacity=max_steps, obs_layout=obs_layout)
+        if trace:
+            env.load_trace(trace)
+        envs.append(env)
+    return envs[:count]
+
+
+def evaluate_chunk(episodes, seeds, policies, max_users, max_steps, trace=None):
+    """
+    在一个进程内并发评估一块 episode
+
+    参数：
+        episodes : episode 序号列表（回放轨迹时决定起始帧）
+        seeds : 对应的 SeedSequence
+        policies : {名称: 策略描述}
+    返回：
+        (episodes, {名称: [每个 episode 的指标字典]})
+    """
+    states = np.zeros((len(episodes), 4 * max_users), dtype=np.float32)  # 各环境直接把观测写入对应行
+    results = {}
+    for name, spec in policies.items():
+        policy = _get_policy(name, spec, max_users)
+        envs = _get_envs(len(episodes), max_users, max_steps, trace, policy.obs_layout)
+        views = states.reshape((len(envs),) + envs[0].observation_space.shape)  # 按策略要求的观测布局写入
+        for env, row, episode, seed in zip(envs, views, episodes, seeds):
+            if trace:
+                env.seek_trace(episode * max_steps)
+            else:
+                env.seed(seed)
+            env.reset(out=row)
+            env.metrics.clear()
+
+        for _ in range(max_steps):
+            actions = policy(states)
+            for env, row, action in zip(envs, views, actions):
+                env.step(action, out=row)
+
+        results[name] = [episode_metrics(env.metrics.window(max_steps)) for env in envs]
+    return episodes, results
+
+
+def evaluate_parallel(policies, episodes, max_steps, max_users, workers=None, batch_episodes=8, threads=1,
+                      seed=0, trace=None):
+    """
+    并行评估多个策略
+
+    参数：
+        policies : {名称: 策略描述}，见 make_policy
+        workers : 进程数，None 时为 CPU 核数；0 时在当前进程内顺序执行各块
+        batch_episodes : 每块并发的 episode 数（即每次策略推理的批量）
+        threads : 每个进程的 torch 线程数
+        seed : 场景种子，episode ep 使用 spawn_seeds(seed, episodes)[ep]
+        trace : 回放的信道轨迹目录
+    返回：
+        {名称: {指标名: 按 episode 顺序的列表}}，与 evaluate_comparison.run_evaluation 的结果格式相同
+    """
+    seeds = spawn_seeds(seed, episodes)
+    chunks = [list(range(start, min(start + batch_episodes, episodes))) for start in range(0, episodes, batch_episodes)]
+    merged = {name: [None] * episodes for name in policies}
+
+    def merge(chunk, results):
+        for name, rows in results.items():
+            for episode, row in zip(chunk, rows):
+                merged[name][episode] = row
+
+    if workers == 0:
+        previous = torch.get_num_threads()  # 在当前进程内执行，结束后恢复调用方的线程数
+        _worker_init(threads)
+        try:
+            for chunk in chunks:
+                merge(*evaluate_chunk(chunk, [seeds[i] for i in chunk], policies, max_users, max_steps, trace))
+        finally:
+            torch.set_num_threads(previous)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_worker_init, initargs=(threads,)) as pool:
+            futures = [pool.submit(evaluate_chunk, chunk, [seeds[i] for i in chunk], policies, max_users,
+                                   max_steps, trace) for chunk in chunks]
+            for future in futures:
+                merge(*future.result())
+
+    return {name: {metric: [row[metric] for row in rows] for metric in METRICS} for name, rows in merged.items()}
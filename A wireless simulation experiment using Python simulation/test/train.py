@@ -1,9 +1,25 @@
+import argparse
+import os
+import sys
+
 import numpy as np
 import torch
 import matplotlib.pyplot as plt
-from ddpg_agent import DDPGAgent
+from ddpg_agent import OBS_LAYOUTS, DDPGAgent
 from wireless_env import WirelessCommEnv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 共享模块位于上级目录
+from checkpoint import Checkpointer
+from cpu_profile import CPUProfile
+from policy_export import export_actor
+from schedule import UpdateSchedule
+from telemetry import NULL_TELEMETRY, Telemetry
+
+parser = argparse.ArgumentParser(description='DDPG 训练（动态用户数）')
+parser.add_argument('--resume', action='store_true', help='从 --checkpoint_dir 中最新的检查点继续训练')
+parser.add_argument('--checkpoint_dir', type=str, default='checkpoints', help='检查点目录')
+args = parser.parse_args()
+
 # ----------------------
 # 超参数配置
 # ----------------------
@@ -11,15 +27,38 @@ EPISODES = 1000
 MAX_STEPS = 200
 MAX_USERS = 50
 MIN_USERS = 10
+NETWORK = 'mlp'  # 'mlp' 或 'set'（基于集合的网络，计算量随有效用户数变化）
+PRIORITIZED = False  # 优先经验回放
+REPLAY_PATH = None  # 例如 'replay_data'：经验存放在磁盘 memmap 中，可超出内存并在重启后接着使用
+COLLECT_STEPS = 1  # 每采集 K 个环境步 ...
+UPDATES_PER_COLLECT = 1  # ... 做 M 次梯度更新
+POLICY_DELAY = 1  # 每 POLICY_DELAY 次 critic 更新更新一次 actor 与目标网络
+CHECKPOINT_EVERY = 50  # 每隔多少个 episode 保存一次检查点（后台线程写盘）
+CHECKPOINT_REPLAY = False  # 检查点是否包含回放缓冲区（增量保存）
+TELEMETRY_PATH = None  # 例如 'telemetry.jsonl' / 'telemetry.csv'：记录各阶段耗时、奖励与损失
+TELEMETRY_EVERY = 10  # 每隔多少个 episode 写出一行遥测
+CPU_PROFILE = False  # 按批量大小选择 torch 线程数（小批量单线程）
+CPU_BF16 = False  # 网络前向使用 CPU bfloat16 autocast（需要 CPU_PROFILE，CPU 支持 bf16 指令时才有收益）
 
 # ----------------------
 # 初始化环境与智能体
 # ----------------------
-env = WirelessCommEnv(max_users=MAX_USERS)
+env = WirelessCommEnv(max_users=MAX_USERS, obs_layout=OBS_LAYOUTS[NETWORK])  # 集合网络使用逐用户布局
+obs_buffers = np.zeros((2, 4 * MAX_USERS), dtype=np.float32)  # 双缓冲：state 与 next_state 交替写入，避免每步分配
+obs_views = obs_buffers.reshape((2,) + env.observation_space.shape)  # 环境按自身布局写入，agent 与回放使用扁平行
 agent = DDPGAgent(
     state_dim=4 * MAX_USERS,
-    action_dim=2 * MAX_USERS
+    action_dim=2 * MAX_USERS,
+    network=NETWORK,
+    prioritized=PRIORITIZED,
+    replay_path=REPLAY_PATH,
+    replay_resume=args.resume,
+    policy_delay=POLICY_DELAY,
+    cpu_profile=CPUProfile(bf16=CPU_BF16) if CPU_PROFILE else None
 )
+schedule = UpdateSchedule(COLLECT_STEPS, UPDATES_PER_COLLECT)
+telemetry = Telemetry(TELEMETRY_PATH, every=TELEMETRY_EVERY) if TELEMETRY_PATH else NULL_TELEMETRY
+agent.telemetry = telemetry
 
 # ----------------------
 # 训练指标记录
@@ -27,28 +66,47 @@ agent = DDPGAgent(
 rewards_history = []
 user_counts = []
 
+# ----------------------
+# 断点续训
+# ----------------------
+checkpointer = Checkpointer(args.checkpoint_dir, every=CHECKPOINT_EVERY, save_replay=CHECKPOINT_REPLAY)
+start_episode = 0
+if args.resume:
+    restored = checkpointer.load(agent, env)
+    if restored is not None:
+        last_episode, extra = restored
+        start_episode = last_episode + 1
+        rewards_history, user_counts = extra['rewards_history'], extra['user_counts']
+        env.current_num_users = extra['num_users']
+        print(f"从 episode {last_episode} 的检查点继续训练")
+
 # ----------------------
 # 主训练循环
 # ----------------------
-for episode in range(EPISODES):
+for episode in range(start_episode, EPISODES):
     # 动态调整用户数量
     if episode % 10 == 0:
         new_users = np.random.randint(MIN_USERS, MAX_USERS + 1)
         env.current_num_users = new_users
 
-    state = env.reset()
+    env.reset(out=obs_views[0])
+    state = obs_buffers[0]
     episode_reward = 0
 
-    for _ in range(MAX_STEPS):
+    for t in range(MAX_STEPS):
         # 选择动作（使用完整状态）
-        action = agent.select_action(state)
+        with telemetry.phase('select_action'):
+            action = agent.select_action(state)
 
         # 与环境交互
-        next_state, reward, done, _ = env.step(action)
+        with telemetry.phase('env_step'):
+            _, reward, _, _, _ = env.step(action, out=obs_views[(t + 1) % 2])
+            next_state = obs_buffers[(t + 1) % 2]
 
         # 存储经验
-        agent.save_experience(state, action, reward, next_state)
-        agent.update()
+        with telemetry.phase('replay_push'):
+            agent.save_experience(state, action, reward, next_state)
+        schedule.step(agent)
 
         # 状态转移
         state = next_state
@@ -57,18 +115,26 @@ for episode in range(EPISODES):
     # 记录训练指标
     rewards_history.append(episode_reward)
     user_counts.append(env.current_num_users)
+    telemetry.end_episode(episode, episode_reward)
 
     # 打印训练进度
     if episode % 50 == 0:
         avg_reward = episode_reward / MAX_STEPS
         print(f"Episode {episode} | Users: {env.current_num_users} | "
               f"Total Reward: {episode_reward:.1f} | Avg: {avg_reward:.2f}")
+    checkpointer.maybe_save(agent, episode, env, {'rewards_history': rewards_history, 'user_counts': user_counts,
+                                                  'num_users': env.current_num_users})
+checkpointer.close()
+telemetry.close()
 
 # ----------------------
 # 保存与可视化
 # ----------------------
+if REPLAY_PATH:
+    agent.replay_buffer.flush()  # 最后一个未满的块也写入磁盘
 torch.save(agent.actor.state_dict(), "actor.pth")
 torch.save(agent.critic.state_dict(), "critic.pth")
+export_actor(agent.actor, "actor.ts.pt", 4 * MAX_USERS, meta={'variant': 'test', 'network': NETWORK})  # 部署用
 
 plt.figure(figsize=(12, 5))
 plt.subplot(1, 2, 1)
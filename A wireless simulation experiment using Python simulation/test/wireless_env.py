@@ -1,21 +1,39 @@
-import gym
-from gym import spaces
+import os
+import sys
+
+import gymnasium as gym
+from gymnasium import spaces
 import numpy as np
+from mobility import make_mobility
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 共享模块位于上级目录
+from kpi import reduce_kpis, user_kpis
+from metrics_ring import KPI_FIELDS, MetricsRing
+from rng import make_streams
+from channel_trace import TraceReader, TraceWriter
 
 
 class WirelessCommEnv(gym.Env):
-    def __init__(self, max_users=50):
+    def __init__(self, max_users=50, shadowing_std=0.0, fast_fading=False,
+                 mobility=None, slot_duration=1.0, gain_update_threshold=1.0, seed=None,
+                 reuse_obs_buffer=False, obs_layout='flat', metrics_capacity=None):
         super(WirelessCommEnv, self).__init__()
 
         # 核心参数
         self.max_users = max_users
         self.current_num_users = 10
 
+        # 观测布局：'flat' - [CSI, QoS, 负载, 干扰] 四段拼接；'per_user' - (max_users, 4)，每行一个用户
+        if obs_layout not in ('flat', 'per_user'):
+            raise ValueError(f"未知的观测布局: {obs_layout}")
+        self.obs_layout = obs_layout
+        obs_shape = (4 * self.max_users,) if obs_layout == 'flat' else (self.max_users, 4)
+
         # 定义固定维度空间
         self.observation_space = spaces.Box(
             low=0,
             high=1,
-            shape=(4 * self.max_users,),  # 固定维度：4*最大用户数
+            shape=obs_shape,  # 固定维度：4*最大用户数
             dtype=np.float32
         )
         self.action_space = spaces.Box(
@@ -25,86 +43,283 @@ class WirelessCommEnv(gym.Env):
             dtype=np.float32
         )
 
+        # 观测缓冲区：reuse_obs_buffer=True 时每次都写入同一个 float32 数组（调用方需自行拷贝要保留的观测）
+        self.reuse_obs_buffer = reuse_obs_buffer
+        self._obs_buf = np.zeros(obs_shape, dtype=np.float32)
+        self._active_mask = np.zeros(self.max_users, dtype=bool)
+
         # 无线通信参数
         self.max_power = 20  # 最大发射功率（瓦）
         self.noise_floor = 1e-9  # 噪声基底（瓦）
         self.frequency = 3.5e9  # 载波频率（Hz）
 
-    def reset(self):
+        # 小尺度信道参数（默认关闭，与原始模型一致）
+        self.shadowing_std = shadowing_std  # 阴影衰落标准差（dB）
+        self.fast_fading = fast_fading  # 是否叠加瑞利快衰落
+
+        # 信道缓存：大尺度增益只在用户位置变化时重算
+        self._user_positions = None
+        self._large_scale_gain = None
+        self.channel_gain = None  # 当前时隙的信道实现，状态与SINR共用
+        self._gain_positions = None  # 缓存增益对应的用户位置
+
+        # 用户移动模型：None 表示沿用每步重新采样全部用户的原始行为
+        if isinstance(mobility, str):
+            mobility = make_mobility(mobility)
+        self.mobility = mobility  # MobilityModel 实例
+        self.slot_duration = slot_duration  # 每个step对应的时间（秒）
+        self.gain_update_threshold = gain_update_threshold  # 用户移动超过该距离（米）才更新其路径损耗
+
+        # 每个时隙的随机量（阴影/快衰落为 None 表示未启用）
+        self.shadowing = None
+        self.fading = None
+        self.load = None
+        self.interference = None
+
+        # 指标环形缓冲区：metrics_capacity 不为 None 时，每步的逐用户 KPI 写入 self.metrics，
+        # step 返回的 info 只含行号，且是同一个字典对象（只在下一次 step 之前有效）
+        self.metrics = MetricsRing(metrics_capacity, max_users) if metrics_capacity else None
+        self._ring_info = {'metrics_row': -1}
+        self._kpi_scratch = np.zeros((5, max_users))  # float64 中间结果，低 SINR 时 float32 的 1+sinr 会丢失精度
+
+        # 信道轨迹录制/回放
+        self._trace_writer = None
+        self._trace = None
+        self._trace_cursor = 0
+        self._trace_frame = None
+
+        # 每个随机组件独立的随机数流
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """seed 可以是 int / None / SeedSequence（并行 worker 传入 spawn 出的子序列）"""
+        self._rng = make_streams(seed, ('positions', 'qos', 'shadowing', 'fading',
+                                        'load', 'interference', 'delay', 'mobility'))
+        if self.mobility is not None:
+            self.mobility.rng = self._rng['mobility']
+        return [seed]
+
+    @property
+    def user_positions(self):
+        return self._user_positions
+
+    @user_positions.setter
+    def user_positions(self, positions):
+        # 用户移动或用户数变化都会重新赋值位置，此时大尺度增益失效
+        self._user_positions = positions
+        self._large_scale_gain = None
+
+    def reset(self, seed=None, options=None, out=None):
+        """
+        Gymnasium 接口，返回 (obs, info)
+
+        out 为调用方提供的 float32 数组，观测直接写入其中；
+        形状与 observation_space 一致：obs_layout='flat' 时为 (4*max_users,)，'per_user' 时为 (max_users, 4)
+        """
+        super(WirelessCommEnv, self).reset(seed=seed)
+        if seed is not None:
+            self.seed(seed)
+        return self._new_slot(out), {}
+
+    def _new_slot(self, out=None):
+        """重新撒点并生成观测；回放模式下从轨迹当前位置继续，不重新采样"""
+        if self._trace is not None:
+            return self._replay_frame(out)
+
         # 生成有效状态数据
-        self.user_positions = np.random.uniform(50, 500, self.current_num_users)
-        self.qos_demand = np.random.randint(1, 5, self.current_num_users)
-
-        # 生成有效状态并填充到最大维度
-        valid_state = self._generate_valid_state()
-        padded_state = np.zeros(4 * self.max_users)
-        padded_state[:4 * self.current_num_users] = valid_state
-        return padded_state
-
-    def _generate_valid_state(self):
-        """生成实际用户数对应的状态向量"""
-        path_loss = 35.2 + 37.6 * np.log10(self.user_positions)
-        csi = 10 ** (-path_loss / 20)  # 信道状态信息
-        load = np.random.uniform(0, 1, self.current_num_users)  # 基站负载
-        interference = np.random.uniform(0, 0.2, self.current_num_users)  # 干扰水平
-
-        return np.concatenate([
-            csi,
-            self.qos_demand / 5.0,
-            load,
-            interference
-        ])
-
-    def step(self, action):
-        # 截取有效动作部分
-        valid_action = action[:2 * self.current_num_users]
-
-        # 资源分配
-        rb_alloc = valid_action[:self.current_num_users]
-        power_alloc = valid_action[self.current_num_users:] * self.max_power
-
-        # 物理层计算 -------------------------------
-        # 信干噪比计算
-        path_loss = 35.2 + 37.6 * np.log10(self.user_positions)
-        channel_gain = 10 ** (-path_loss / 20)
-        interference = self.noise_floor + np.mean(power_alloc) * 0.05  # 相邻小区干扰
-
-        sinr = (power_alloc * channel_gain) / interference
-
-        # 吞吐量计算（Mbps）
-        throughput = 180e3 * np.log2(1 + sinr) / 1e6
-
-        # QoS指标计算 -------------------------------
-        # 延迟模型：基础延迟 + 队列延迟
-        base_delay = np.random.uniform(1, 5, self.current_num_users)
-        queue_delay = 10 / (throughput + 1e-6)  # 防止除零
-        delay = base_delay + queue_delay
-
-        # 丢包率模型：与资源块分配负相关
-        packet_loss = np.clip(0.25 - (rb_alloc * 0.2), 0, 1)
-
-        # 能效计算（Mbps/W）
-        energy_efficiency = throughput / (power_alloc + 1e-6)
+        self.user_positions = self._rng['positions'].uniform(50, 500, self.current_num_users)
+        self.qos_demand = self._rng['qos'].integers(1, 5, self.current_num_users)
+        if self.mobility is not None:
+            self.mobility.reset(self.user_positions)
+        self.channel_gain = self._draw_channel()
+        return self._padded_state(out)
 
-        # 奖励计算 -------------------------------
-        throughput_reward = np.sum(throughput)
-        power_penalty = 0.1 * np.sum(power_alloc)
-        qos_penalty = 0.05 * np.sum(delay) + 0.2 * np.sum(packet_loss)
-        reward = throughput_reward - power_penalty - qos_penalty
+    def _padded_state(self, out=None):
+        """按 [CSI, QoS, 负载, 干扰] 分段写入 float32 观测，超出当前用户数的部分填0"""
+        if out is None:
+            out = self._obs_buf if self.reuse_obs_buffer else np.empty(self._obs_buf.shape, dtype=np.float32)
+        self._draw_state_noise()
+        n = self.current_num_users
+        if self.obs_layout == 'per_user':
+            out[:n, 0] = self.channel_gain
+            np.divide(self.qos_demand, 5.0, out=out[:n, 1])
+            out[:n, 2] = self.load
+            out[:n, 3] = self.interference
+            out[n:] = 0
+            return out
+        out[:n] = self.channel_gain  # 信道状态信息
+        np.divide(self.qos_demand, 5.0, out=out[n:2 * n])
+        out[2 * n:3 * n] = self.load
+        out[3 * n:4 * n] = self.interference
+        out[4 * n:] = 0
+        return out
+
+    def _move_users(self):
+        """按移动模型增量推进用户位置，只为移动超过阈值的用户更新路径损耗"""
+        distances = self.mobility.step(self.slot_duration)
+        self._user_positions = distances  # 直接写内部数组，避免setter使整个缓存失效
+        moved = np.abs(distances - self._gain_positions) > self.gain_update_threshold
+        if np.any(moved):
+            path_loss = 35.2 + 37.6 * np.log10(distances[moved])
+            self._large_scale_gain[moved] = 10 ** (-path_loss / 20)
+            self._gain_positions[moved] = distances[moved]
+        self.channel_gain = self._draw_channel()
+
+    def _large_scale_gain_cached(self):
+        """路径损耗对应的大尺度增益，缓存到用户位置下一次变化"""
+        if self._large_scale_gain is None:
+            path_loss = 35.2 + 37.6 * np.log10(self.user_positions)
+            self._large_scale_gain = 10 ** (-path_loss / 20)
+            self._gain_positions = np.array(self.user_positions, dtype=float)
+        return self._large_scale_gain
+
+    def _draw_channel(self):
+        """抽取本时隙的阴影衰落和快衰落"""
+        n = self.current_num_users
+        self.shadowing = self._rng['shadowing'].normal(0, self.shadowing_std, n) if self.shadowing_std > 0 else None
+        self.fading = np.sqrt(self._rng['fading'].exponential(1.0, n)) if self.fast_fading else None  # 瑞利幅度
+        return self._compose_channel()
+
+    def _compose_channel(self):
+        """在大尺度增益上叠加阴影衰落和快衰落"""
+        gain = self._large_scale_gain_cached().copy()
+        if self.shadowing is not None:
+            gain *= 10 ** (-self.shadowing / 20)
+        if self.fading is not None:
+            gain *= self.fading
+        return gain
+
+    @property
+    def active_mask(self):
+        """有效用户掩码 (max_users,)，前 current_num_users 个为 True（内部数组，下次访问时会被改写）"""
+        self._active_mask[:] = False
+        self._active_mask[:self.current_num_users] = True
+        return self._active_mask
+
+    def _draw_state_noise(self):
+        """抽取状态中的负载和干扰（回放模式下已由轨迹给出）"""
+        if self._trace is None:
+            self.load = self._rng['load'].uniform(0, 1, self.current_num_users)  # 基站负载
+            self.interference = self._rng['interference'].uniform(0, 0.2, self.current_num_users)  # 干扰水平
+
+    def step(self, action, out=None):
+        """Gymnasium 接口，返回 (obs, reward, terminated, truncated, info)；持续仿真，两个结束标志恒为 False"""
+        n = self.current_num_users
+        ring = self.metrics
+        if ring is not None:
+            # 在预分配的 float64 缓冲区中计算，随后写入环形缓冲区的当前行
+            kpis = dict(zip(KPI_FIELDS, self._kpi_scratch[:, :n]))
+        else:
+            kpis = {name: np.empty(n) for name in KPI_FIELDS}
+
+        # QoS指标计算所需的基础延迟
+        if self._trace is not None:
+            base_delay = self._trace_frame['base_delay']
+        else:
+            base_delay = self._rng['delay'].uniform(1, 5, n)
+        reward = self._compute_kpis(action, base_delay, **kpis)
+
+        if self._trace_writer is not None:
+            self._record_slot(base_delay)
 
         # 状态更新 -------------------------------
-        next_state = self.reset()  # 保持固定维度状态
+        if self._trace is not None:
+            self._trace_cursor += 1
+            next_state = self._replay_frame(out)
+        elif self.mobility is None:
+            next_state = self._new_slot(out)  # 保持固定维度状态
+        else:
+            self._move_users()
+            next_state = self._padded_state(out)
 
         # 信息收集 -------------------------------
+        if ring is not None:
+            for name in ring.fields:
+                ring.row(name, n)[:] = kpis[name]
+            self._ring_info['metrics_row'] = ring.commit(n, reward)
+            return next_state, reward, False, False, self._ring_info
         info = {
-            'throughput': throughput,  # 各用户吞吐量 (Mbps)
-            'delay': delay,  # 各用户端到端延迟 (ms)
-            'packet_loss': packet_loss,  # 各用户丢包率 (0-1)
-            'power': power_alloc,  # 各用户发射功率 (W)
-            'energy_efficiency': energy_efficiency  # 各用户能效
+            'throughput': kpis['throughput'],  # 各用户吞吐量 (Mbps)
+            'delay': kpis['delay'],  # 各用户端到端延迟 (ms)
+            'packet_loss': kpis['packet_loss'],  # 各用户丢包率 (0-1)
+            'power': kpis['power'],  # 各用户发射功率 (W)
+            'energy_efficiency': kpis['energy_efficiency'],  # 各用户能效
+            'active_mask': self.active_mask.copy()  # 下一状态中的有效用户
         }
+        return next_state, reward, False, False, info
+
+    def _compute_kpis(self, action, base_delay, **out):
+        """按动作计算各用户指标，结果写入 out 中长度为 current_num_users 的数组，返回奖励"""
+        n = self.current_num_users
+
+        # 资源分配（截取有效动作部分）
+        rb_alloc = action[:n]
+        power = np.multiply(action[n:2 * n], self.max_power, out=out['power'])
+
+        # 逐用户指标（SINR 使用与当前状态相同的信道实现）
+        interference = self.noise_floor + np.mean(power) * 0.05  # 相邻小区干扰
+        user_kpis(rb_alloc, power, self.channel_gain, interference, base_delay, out)
+
+        # 奖励计算 -------------------------------
+        sums = reduce_kpis(out['throughput'], power, delay=out['delay'], packet_loss=out['packet_loss'])
+        power_penalty = 0.1 * sums['sum_power']
+        qos_penalty = 0.05 * sums['sum_delay'] + 0.2 * sums['sum_packet_loss']
+        return float(sums['sum_throughput'] - power_penalty - qos_penalty)
+
+    # 信道轨迹 -------------------------------
+    def start_recording(self, path, chunk_frames=1024):
+        """开始把每个时隙的位置、衰落等随机量写入轨迹目录"""
+        self.stop_recording()
+        self._trace_writer = TraceWriter(path, self.max_users, chunk_frames)
+
+    def stop_recording(self):
+        if self._trace_writer is not None:
+            self._trace_writer.close()
+            self._trace_writer = None
+
+    def load_trace(self, path):
+        """进入回放模式：之后的 reset/step 按顺序读取轨迹中的时隙"""
+        trace = TraceReader(path)
+        if trace.max_users > self.max_users:
+            raise ValueError(f"轨迹的 max_users={trace.max_users} 超过环境的 {self.max_users}")
+        self._trace = trace
+        self._trace_cursor = 0
+
+    def seek_trace(self, frame=0):
+        """回放位置跳到第 frame 个时隙，用于让不同算法看到相同的信道序列"""
+        self._trace_cursor = frame
+
+    def stop_replay(self):
+        self._trace = None
+        self._trace_frame = None
+
+    def _record_slot(self, base_delay):
+        # 记录计算路径损耗所用的位置：开启移动模型时增益只在移动超过阈值后更新，
+        # 记录真实位置会使回放的信道与录制时不一致
+        self._trace_writer.append(
+            self.current_num_users,
+            positions=self._gain_positions,
+            qos_demand=self.qos_demand,
+            load=self.load,
+            interference=self.interference,
+            shadowing=0.0 if self.shadowing is None else self.shadowing,
+            fading=1.0 if self.fading is None else self.fading,
+            base_delay=base_delay
+        )
 
-        return next_state, reward, False, info
+    def _replay_frame(self, out=None):
+        """用轨迹中当前时隙的数据（memmap 行视图）构造状态"""
+        frame = self._trace.frame(self._trace_cursor)
+        self._trace_frame = frame
+        self.current_num_users = frame['num_users']
+        self.user_positions = frame['positions']
+        self.qos_demand = frame['qos_demand']
+        self.load = frame['load']
+        self.interference = frame['interference']
+        self.shadowing = frame['shadowing']
+        self.fading = frame['fading']
+        self.channel_gain = self._compose_channel()
+        return self._padded_state(out)
 
     def render(self, mode='human'):
         pass
\ No newline at end of file
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: test_replay.py
+@time: 23/6/2025 上午 10:20
+@functions：回放缓冲区的回归测试：连续两次 sample 不能改写前一次返回的批量；memmap 目录已有经验时须显式 resume
+
+运行：python -m pytest -q test_replay.py
+"""
+import numpy as np
+import pytest
+import torch
+
+from replay import MemmapReplayBuffer, PrioritizedReplayBuffer, ReplayBuffer
+
+STATE_DIM, ACTION_DIM = 8, 4
+
+
+def fill(buffer, count=512, chunk=128, seed=0):
+    rng = np.random.default_rng(seed)
+    for start in range(0, count, chunk):
+        rows = min(chunk, count - start)
+        buffer.push_batch(rng.random((rows, STATE_DIM)), rng.random((rows, ACTION_DIM)), rng.random(rows),
+                          rng.random((rows, STATE_DIM)))
+    return buffer
+
+
+def assert_back_to_back_samples_independent(buffer, batch_size=64):
+    first = buffer.sample(batch_size)
+    expected = [tensor.cpu().clone() for tensor in first[:5]]
+    second = buffer.sample(batch_size)
+    if buffer.device.type == 'cuda':
+        torch.cuda.synchronize()
+    for tensor, copy in zip(first[:5], expected):
+        assert torch.equal(tensor.cpu(), copy)
+    # 两次采样确实取了不同的经验
+    assert not torch.equal(first[0].cpu(), second[0].cpu())
+
+
+def test_sample_does_not_overwrite_previous_batch():
+    assert_back_to_back_samples_independent(fill(ReplayBuffer(1024, STATE_DIM, ACTION_DIM, seed=1)))
+
+
+def test_prioritized_sample_does_not_overwrite_previous_batch():
+    assert_back_to_back_samples_independent(fill(PrioritizedReplayBuffer(1024, STATE_DIM, ACTION_DIM, seed=1)))
+
+
+def test_memmap_sample_does_not_overwrite_previous_batch(tmp_path):
+    buffer = MemmapReplayBuffer(1024, STATE_DIM, ACTION_DIM, str(tmp_path / 'replay'), hot_capacity=128,
+                                flush_rows=64, seed=1)
+    assert_back_to_back_samples_independent(fill(buffer))  # 同一批中既有内存热区也有磁盘上的行
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason='需要 CUDA')
+def test_pinned_cuda_sample_does_not_overwrite_previous_batch():
+    buffer = fill(ReplayBuffer(1 << 16, STATE_DIM, ACTION_DIM, device='cuda', seed=1), count=1 << 16)
+    assert_back_to_back_samples_independent(buffer, batch_size=8192)
+
+
+def test_memmap_existing_directory_requires_resume(tmp_path):
+    path = str(tmp_path / 'replay')
+    buffer = fill(MemmapReplayBuffer(1024, STATE_DIM, ACTION_DIM, path, hot_capacity=128, flush_rows=64, seed=1))
+    buffer.flush()
+    size = buffer.size
+    with pytest.raises(FileExistsError):
+        MemmapReplayBuffer(1024, STATE_DIM, ACTION_DIM, path, hot_capacity=128, flush_rows=64)
+    resumed = MemmapReplayBuffer(1024, STATE_DIM, ACTION_DIM, path, hot_capacity=128, flush_rows=64, resume=True)
+    assert resumed.size == size
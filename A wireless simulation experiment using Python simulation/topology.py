@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: 'Guohan'
+@file: topology.py
+@time: 8/6/2025 上午 10:15
+@functions：多小区拓扑，基于空间网格索引的稀疏邻区结构和小区间干扰计算
+"""
+import numpy as np
+
+
+def hex_grid(num_cells, inter_site_distance):
+    """六边形蜂窝布局，按到中心的距离由近到远取 num_cells 个基站坐标"""
+    rings = 1
+    while 3 * rings * (rings + 1) + 1 < num_cells:
+        rings += 1
+    q, r = np.meshgrid(np.arange(-rings, rings + 1), np.arange(-rings, rings + 1), indexing='ij')
+    q, r = q.ravel(), r.ravel()
+    inside = np.abs(q + r) <= rings
+    q, r = q[inside], r[inside]
+    xy = inter_site_distance * np.stack([q + r / 2.0, r * np.sqrt(3) / 2.0], axis=1)
+    order = np.argsort(np.hypot(xy[:, 0], xy[:, 1]), kind='stable')
+    return xy[order[:num_cells]]
+
+
+class MultiCellTopology:
+    """
+    多小区多基站拓扑
+
+    每个用户只与 interference_radius 内的基站建立链路，链路以 COO 稀疏格式 (link_user, link_cell, link_gain) 保存。
+    邻区搜索使用边长为 interference_radius 的均匀网格，只检查用户所在网格及周围 8 个网格中的基站。
+    SINR 通过两次 bincount（每小区总功率、稀疏矩阵-向量乘）得到，开销与链路数成正比而不是用户数的平方。
+    """
+
+    def __init__(self, num_cells=19, users_per_cell=10, inter_site_distance=500.0,
+                 interference_radius=1500.0, min_distance=10.0, path_loss_coeff=34.5):
+        self.num_cells = num_cells
+        self.users_per_cell = users_per_cell
+        self.num_users = num_cells * users_per_cell
+        self.inter_site_distance = inter_site_distance
+        self.cell_radius = inter_site_distance / np.sqrt(3)  # 六边形外接圆半径
+        if interference_radius < self.cell_radius:
+            raise ValueError("interference_radius 不能小于小区半径，否则服务基站可能不在邻区内")
+        self.interference_radius = interference_radius
+        self.min_distance = min_distance
+        self.path_loss_coeff = path_loss_coeff
+
+        self.bs_xy = hex_grid(num_cells, inter_site_distance)
+        self._build_grid_index()
+
+    def _build_grid_index(self):
+        """基站按网格编号排序，便于用 searchsorted 找到某个网格内的全部基站"""
+        size = self.interference_radius
+        bs_grid = np.floor(self.bs_xy / size).astype(np.int64)
+        self._grid_origin = bs_grid.min(axis=0) - 1
+        self._grid_dims = bs_grid.max(axis=0) - self._grid_origin + 2
+        keys = self._grid_key(bs_grid)
+        self._bs_order = np.argsort(keys, kind='stable')
+        self._bs_keys = keys[self._bs_order]
+
+    def _grid_key(self, grid):
+        local = grid - self._grid_origin
+        key = local[:, 0] * self._grid_dims[1] + local[:, 1]
+        outside = np.any((local < 0) | (local >= self._grid_dims), axis=1)
+        key[outside] = -1  # 不存在的网格，searchsorted 得到空区间
+        return key
+
+    def drop_users(self, rng=np.random):
+        """在每个基站周围均匀撒 users_per_cell 个用户，并重建邻区链路"""
+        r = np.sqrt(rng.uniform(self.min_distance ** 2, self.cell_radius ** 2, self.num_users))
+        angle = rng.uniform(0, 2 * np.pi, self.num_users)
+        home = np.repeat(np.arange(self.num_cells), self.users_per_cell)
+        self.user_xy = self.bs_xy[home] + np.stack([r * np.cos(angle), r * np.sin(angle)], axis=1)
+        self.build_links()
+        return self.user_xy
+
+    def _candidate_links(self):
+        """网格索引：返回用户与周围 3x3 网格内基站的候选配对"""
+        size = self.interference_radius
+        user_grid = np.floor(self.user_xy / size).astype(np.int64)
+        users = np.arange(self.num_users)
+        rows, cols = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                keys = self._grid_key(user_grid + np.array([dx, dy]))
+                lo = np.searchsorted(self._bs_keys, keys, side='left')
+                hi = np.searchsorted(self._bs_keys, keys, side='right')
+                counts = np.where(keys >= 0, hi - lo, 0)
+                total = int(counts.sum())
+                if total == 0:
+                    continue
+                # 把每个用户的 [lo, hi) 区间展开成扁平的基站下标
+                offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+                rows.append(np.repeat(users, counts))
+                cols.append(self._bs_order[np.repeat(lo, counts) + offsets])
+        return np.concatenate(rows), np.concatenate(cols)
+
+    def build_links(self):
+        """计算截止半径内的链路增益，并把每个用户关联到增益最大的基站"""
+        rows, cols = self._candidate_links()
+        diff = self.user_xy[rows] - self.bs_xy[cols]
+        distance = np.hypot(diff[:, 0], diff[:, 1])
+        keep = distance <= self.interference_radius
+        rows, cols, distance = rows[keep], cols[keep], np.maximum(distance[keep], self.min_distance)
+
+        # 按用户排序（CSR 行顺序），链路增益沿用单小区的路径损耗模型
+        order = np.lexsort((cols, rows))
+        self.link_user, self.link_cell = rows[order], cols[order]
+        self.link_distance = distance[order]
+        pl = self.path_loss_coeff + 20 * np.log10(self.link_distance)
+        self.link_gain = 10 ** (-pl / 20)
+
+        # 服务基站 = 最近基站（路径损耗单调，即增益最大者）
+        nearest = np.full(self.num_users, np.inf)
+        np.minimum.at(nearest, self.link_user, self.link_distance)
+        is_serving = self.link_distance == nearest[self.link_user]
+        first = np.flatnonzero(is_serving)
+        first = first[np.unique(self.link_user[first], return_index=True)[1]]
+        self.serving_cell = self.link_cell[first]
+        self.serving_distance = self.link_distance[first]
+        self.serving_gain = self.link_gain[first]
+
+    @property
+    def num_links(self):
+        return len(self.link_user)
+
+    def received_power(self, power, scale=1.0):
+        """每个用户收到的总功率（服务小区 + 邻区），即稀疏增益矩阵与每小区总功率的乘积"""
+        cell_power = np.bincount(self.serving_cell, weights=power, minlength=self.num_cells)
+        return scale * np.bincount(self.link_user, weights=self.link_gain * cell_power[self.link_cell],
+                                   minlength=self.num_users)
+
+    def sinr(self, power, noise_power, scale=1.0):
+        """
+        参数：
+            power : 每个用户的下行发射功率 (num_users,)
+            noise_power : 噪声功率（瓦）
+            scale : 本时隙的全局衰落因子（例如阴影衰落）
+        """
+        signal = scale * power * self.serving_gain
+        interference = self.received_power(power, scale) - signal
+        return signal / (np.maximum(interference, 0) + noise_power)
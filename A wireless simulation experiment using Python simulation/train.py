@@ -6,59 +6,146 @@
 @time: 27/5/2025 上午 12:21
 @functions：训练主程序
 """
+import argparse
+
+from checkpoint import Checkpointer
+from cpu_profile import CPUProfile
 from ddpg_agent import DDPGAgent
-from wireless_env import WirelessCommEnv
+from exploration import NOISES
+from policy_export import export_actor
+from schedule import UpdateSchedule
+from telemetry import NULL_TELEMETRY, Telemetry
+from wireless_env import WirelessCommEnv, VectorWirelessCommEnv
 import matplotlib.pyplot as plt
 import numpy as np
 import torch
+
+parser = argparse.ArgumentParser(description='DDPG 训练')
+parser.add_argument('--resume', action='store_true', help='从 --checkpoint_dir 中最新的检查点继续训练')
+parser.add_argument('--checkpoint_dir', type=str, default='checkpoints', help='检查点目录')
+args = parser.parse_args()
+
 # 超参数设置
 EPISODES = 1000
 MAX_STEPS = 200
 NUM_USERS = 10  # 动态变化范围在env中处理
+NUM_ENVS = 1  # >1 时使用 VectorWirelessCommEnv 同时仿真多个小区 (用户数固定)
+PRIORITIZED = False  # 优先经验回放
+REPLAY_PATH = None  # 例如 'replay_data'：经验存放在磁盘 memmap 中，可超出内存并在重启后接着使用
+COLLECT_STEPS = NUM_ENVS  # 每采集 K 个环境步 ...
+UPDATES_PER_COLLECT = 1  # ... 做 M 次梯度更新（默认与每次 step 更新一次相同）
+POLICY_DELAY = 1  # 每 POLICY_DELAY 次 critic 更新更新一次 actor 与目标网络
+EXPLORATION = 'gaussian'  # 向量训练的探索噪声：'gaussian' 或 'ou'（每个环境一条 Ornstein-Uhlenbeck 轨迹）
+CHECKPOINT_EVERY = 50  # 每隔多少个 episode 保存一次检查点（后台线程写盘）
+CHECKPOINT_REPLAY = False  # 检查点是否包含回放缓冲区（增量保存）
+TELEMETRY_PATH = None  # 例如 'telemetry.jsonl' / 'telemetry.csv'：记录各阶段耗时、奖励与损失
+TELEMETRY_EVERY = 10  # 每隔多少个 episode 写出一行遥测
+CPU_PROFILE = False  # 按批量大小选择 torch 线程数（小批量单线程）
+CPU_BF16 = False  # 网络前向使用 CPU bfloat16 autocast（需要 CPU_PROFILE，CPU 支持 bf16 指令时才有收益）
 
 # 初始化环境和智能体
-env = WirelessCommEnv(num_users=NUM_USERS)
-state_dim = env.observation_space.shape[0]
-action_dim = env.action_space.shape[0]
-agent = DDPGAgent(state_dim, action_dim)
+if NUM_ENVS > 1:
+    env = VectorWirelessCommEnv(num_envs=NUM_ENVS, num_users=NUM_USERS)
+    state_dim = env.single_observation_space.shape[0]
+    action_dim = env.single_action_space.shape[0]
+else:
+    env = WirelessCommEnv(num_users=NUM_USERS)
+    state_dim = env.observation_space.shape[0]
+    action_dim = env.action_space.shape[0]
+agent = DDPGAgent(state_dim, action_dim, prioritized=PRIORITIZED, replay_path=REPLAY_PATH, replay_resume=args.resume,
+                  policy_delay=POLICY_DELAY,
+                  cpu_profile=CPUProfile(bf16=CPU_BF16) if CPU_PROFILE else None)
+schedule = UpdateSchedule(COLLECT_STEPS, UPDATES_PER_COLLECT)
+if NUM_ENVS > 1:
+    noise = NOISES[EXPLORATION](NUM_ENVS, action_dim)
+telemetry = Telemetry(TELEMETRY_PATH, every=TELEMETRY_EVERY) if TELEMETRY_PATH else NULL_TELEMETRY
+agent.telemetry = telemetry
 
-# 训练循环
+# 断点续训
+checkpointer = Checkpointer(args.checkpoint_dir, every=CHECKPOINT_EVERY, save_replay=CHECKPOINT_REPLAY)
+start_episode = 0
 episode_rewards = []
-for episode in range(EPISODES):
-    state = env.reset()
-    total_reward = 0
+if args.resume:
+    restored = checkpointer.load(agent, env)
+    if restored is not None:
+        last_episode, extra = restored
+        start_episode = last_episode + 1
+        episode_rewards = extra['episode_rewards']
+        print(f"从 episode {last_episode} 的检查点继续训练")
+
+# 训练循环
+if NUM_ENVS > 1:
+    for episode in range(start_episode, EPISODES):
+        # 批量训练: select_actions 接受 (NUM_ENVS, state_dim) 的状态矩阵
+        states, _ = env.reset()
+        noise.reset()
+        total_reward = np.zeros(NUM_ENVS)
+
+        for step in range(MAX_STEPS):
+            with telemetry.phase('select_action'):
+                actions = agent.select_actions(states, noise=noise)
+            with telemetry.phase('env_step'):
+                next_states, rewards, _, _, _ = env.step(actions)
+
+            with telemetry.phase('replay_push'):
+                agent.save_experience_batch(states, actions, rewards, next_states)
+            schedule.step(agent, env_steps=NUM_ENVS)
+
+            states = next_states
+            total_reward += rewards
+
+        episode_rewards.append(np.mean(total_reward))
+        telemetry.end_episode(episode, episode_rewards[-1])
+
+        if episode % 50 == 0:
+            print(f"Episode {episode}, Mean Reward over {NUM_ENVS} envs: {np.mean(total_reward):.2f}")
+        checkpointer.maybe_save(agent, episode, env, {'episode_rewards': episode_rewards})
+else:
+    for episode in range(start_episode, EPISODES):
+        state, _ = env.reset()
+        total_reward = 0
 
-    # 动态改变用户数量 (每10个episode变化一次)
-    if episode % 10 == 0:
-        env.num_users = np.random.randint(10, 50)
-        env.reset()
+        # 动态改变用户数量 (每10个episode变化一次)
+        if episode % 10 == 0:
+            env.num_users = np.random.randint(10, 50)
+            env.reset()
 
-    for step in range(MAX_STEPS):
-        # 选择动作并执行
-        action = agent.select_action(state)
-        next_state, reward, done, _ = env.step(action)
+        for step in range(MAX_STEPS):
+            # 选择动作并执行
+            with telemetry.phase('select_action'):
+                action = agent.select_action(state)
+            with telemetry.phase('env_step'):
+                next_state, reward, terminated, truncated, _ = env.step(action)
 
-        # 存储经验
-        agent.save_experience(state, action, reward, next_state)
+            # 存储经验
+            with telemetry.phase('replay_push'):
+                agent.save_experience(state, action, reward, next_state)
 
-        # 更新网络参数
-        agent.update()
+            # 更新网络参数（按 UpdateSchedule 的 K/M 配置）
+            schedule.step(agent)
 
-        state = next_state
-        total_reward += reward
+            state = next_state
+            total_reward += reward
 
-        if done:
-            break
+            if terminated or truncated:
+                break
 
-    episode_rewards.append(total_reward)
+        episode_rewards.append(total_reward)
+        telemetry.end_episode(episode, total_reward)
 
-    # 打印训练进度
-    if episode % 50 == 0:
-        print(f"Episode {episode}, Reward: {total_reward:.2f}")
+        # 打印训练进度
+        if episode % 50 == 0:
+            print(f"Episode {episode}, Reward: {total_reward:.2f}")
+        checkpointer.maybe_save(agent, episode, env, {'episode_rewards': episode_rewards})
+checkpointer.close()
+telemetry.close()
 
 # 保存模型
+if REPLAY_PATH:
+    agent.replay_buffer.flush()  # 最后一个未满的块也写入磁盘
 torch.save(agent.actor.state_dict(), "ddpg_actor.pth")
 torch.save(agent.critic.state_dict(), "ddpg_critic.pth")
+export_actor(agent.actor, "ddpg_actor.ts.pt", state_dim)  # 部署用：PolicyRunner 只加载该文件
 
 # 绘制训练曲线
 plt.plot(episode_rewards)
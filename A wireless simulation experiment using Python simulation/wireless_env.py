@@ -6,19 +6,22 @@
 @time: 27/5/2025 上午 12:21
 @functions：自定义通信环境
 """
-import gym
-from gym import spaces
+import gymnasium as gym
+from gymnasium import spaces
 import numpy as np
+from kpi import reduce_kpis, throughput_mbps
+from rng import make_streams
+from topology import MultiCellTopology
 
 
 class WirelessCommEnv(gym.Env):
-    def __init__(self, num_users=10, num_rb=100):
+    def __init__(self, num_users=10, num_rb=100, seed=None):
         super(WirelessCommEnv, self).__init__()
         self.num_users = num_users  # 动态用户数
         self.num_rb = num_rb  # 资源块数量
 
         # 状态空间定义: [CSI, QoS需求, 基站负载, 干扰水平]
-        self.observation_space = spaces.Box(low=0, high=1, shape=(4 * num_users,))
+        self.observation_space = spaces.Box(low=0, high=1, shape=(4 * num_users,), dtype=np.float64)
 
         # 动作空间定义: 每个用户的资源分配比例 (power + RB)
         self.action_space = spaces.Box(low=0, high=1, shape=(2 * num_users,))
@@ -31,18 +34,47 @@ class WirelessCommEnv(gym.Env):
         self.path_loss_coeff = 34.5  # dB
         self.shadowing_std = 8  # dB
 
-    def reset(self):
+        # 信道缓存: 大尺度增益只在用户位置变化时重算，阴影衰落每个时隙单独抽取
+        self._user_positions = None
+        self._large_scale_gain = None
+        self.channel_gain = None  # 当前时隙的信道实现，状态与SINR共用
+        self._shadowing_factor = 1.0
+
+        # 随机数流: 位置、QoS需求、阴影衰落各自独立
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """seed 可以是 int / None / SeedSequence（并行 worker 传入 spawn 出的子序列）"""
+        self._rng = make_streams(seed, ('positions', 'qos', 'shadowing'))
+        return [seed]
+
+    @property
+    def user_positions(self):
+        return self._user_positions
+
+    @user_positions.setter
+    def user_positions(self, positions):
+        # 用户移动或用户数变化都会重新赋值位置，此时大尺度增益失效
+        self._user_positions = positions
+        self._large_scale_gain = None
+
+    def reset(self, seed=None, options=None):
+        # Gymnasium 接口: 返回 (obs, info)
+        super(WirelessCommEnv, self).reset(seed=seed)
+        if seed is not None:
+            self.seed(seed)
         # 随机生成用户位置和初始状态
-        self.user_positions = np.random.uniform(50, 500, self.num_users)  # 距离基站50-500米
-        self.qos_demand = np.random.randint(1, 5, self.num_users)  # 1-5 Mbps需求
+        self.user_positions = self._rng['positions'].uniform(50, 500, self.num_users)  # 距离基站50-500米
+        self.qos_demand = self._rng['qos'].integers(1, 5, self.num_users)  # 1-5 Mbps需求
 
         # 初始状态生成
+        self.channel_gain = self._calculate_channel_state()
         state = self._get_state()
-        return state
+        return state, {}
 
     def _get_state(self):
         # 获取当前信道状态
-        csi = self._calculate_channel_state()
+        csi = self.channel_gain
         # 基站负载 (已使用RB比例)
         load = np.sum(self.last_action[:self.num_users]) if hasattr(self, 'last_action') else 0.0
         # 干扰水平 (简化为其他用户总功率的10%)
@@ -56,13 +88,18 @@ class WirelessCommEnv(gym.Env):
         ])
         return state
 
+    def _large_scale_gain_cached(self):
+        # 3GPP UMi路径损耗模型，转换为信道增益 (简化模型)
+        if self._large_scale_gain is None:
+            pl = self.path_loss_coeff + 20 * np.log10(self.user_positions)
+            self._large_scale_gain = 10 ** (-pl / 20)
+        return self._large_scale_gain
+
     def _calculate_channel_state(self):
-        # 3GPP UMi路径损耗模型
-        distance = self.user_positions
-        pl = self.path_loss_coeff + 20 * np.log10(distance) + np.random.normal(0, self.shadowing_std)
-        # 转换为信道增益 (简化模型)
-        channel_gain = 10 ** (-pl / 20)
-        return channel_gain
+        # 在缓存的大尺度增益上叠加本时隙的阴影衰落 (标量，只需一次pow)
+        shadowing = self._rng['shadowing'].normal(0, self.shadowing_std)
+        self._shadowing_factor = 10 ** (-shadowing / 20)
+        return self._large_scale_gain_cached() * self._shadowing_factor
 
     def step(self, action):
         # 解析动作: 前num_users为RB分配，后num_users为功率分配
@@ -71,24 +108,23 @@ class WirelessCommEnv(gym.Env):
 
         # 计算每个用户的吞吐量
         sinr = self._calculate_sinr(power_alloc, rb_alloc)
-        throughput = self.bandwidth * np.log2(1 + sinr) / 1e6  # Mbps
+        throughput = throughput_mbps(sinr, self.bandwidth)  # Mbps
 
         # 奖励函数
         reward = self._calculate_reward(throughput, power_alloc)
 
-        # 生成新状态
+        # 进入下一时隙: 抽取新的信道实现并生成新状态
+        self.channel_gain = self._calculate_channel_state()
         next_state = self._get_state()
 
-        # 判断是否结束 (持续仿真，无终止条件)
-        done = False
-
-        return next_state, reward, done, {}
+        # 持续仿真，无终止/截断条件 (回合长度由训练循环控制)
+        return next_state, reward, False, False, {}
 
     def _calculate_sinr(self, power_alloc, rb_alloc):
         # 简化干扰模型: 其他用户的总功率
         interference = np.sum(power_alloc) - power_alloc
         noise_power = 1e-9  # -90 dBm
-        sinr = (power_alloc * self._calculate_channel_state()) / (interference + noise_power)
+        sinr = (power_alloc * self.channel_gain) / (interference + noise_power)
         return sinr
 
     def _calculate_reward(self, throughput, power_alloc):
@@ -96,10 +132,166 @@ class WirelessCommEnv(gym.Env):
         alpha = 0.7
         # 公平性奖励 (Jain指数)
         beta = 0.2
-        jain_index = np.sum(throughput) ** 2 / (self.num_users * np.sum(throughput ** 2))
         # 能耗惩罚
         gamma = 0.1
-        total_power = np.sum(power_alloc)
+        kpis = reduce_kpis(throughput, power_alloc)
+
+        reward = alpha * kpis['sum_throughput'] + beta * kpis['jain'] - gamma * kpis['sum_power']
+        return reward
+
+class MultiCellWirelessEnv(WirelessCommEnv):
+    """
+    多小区多基站版本
+
+    用户数 = num_cells * users_per_cell，动作与状态布局与 WirelessCommEnv 相同。
+    干扰按接收功率计算: 同小区其他用户 + interference_radius 内邻区基站的总发射功率乘以链路增益，
+    通过 MultiCellTopology 的稀疏链路结构求和，内存和计算量与链路数成正比。
+    """
+
+    def __init__(self, num_cells=19, users_per_cell=10, num_rb=100,
+                 inter_site_distance=500.0, interference_radius=1500.0, seed=None):
+        super(MultiCellWirelessEnv, self).__init__(num_users=num_cells * users_per_cell, num_rb=num_rb, seed=seed)
+        self.topology = MultiCellTopology(
+            num_cells=num_cells,
+            users_per_cell=users_per_cell,
+            inter_site_distance=inter_site_distance,
+            interference_radius=interference_radius,
+            path_loss_coeff=self.path_loss_coeff
+        )
+
+    def reset(self, seed=None, options=None):
+        gym.Env.reset(self, seed=seed)
+        if seed is not None:
+            self.seed(seed)
+        # 重新撒点并建立邻区链路，位置取到服务基站的距离
+        self.topology.drop_users(self._rng['positions'])
+        self.user_positions = self.topology.serving_distance
+        self.qos_demand = self._rng['qos'].integers(1, 5, self.num_users)
+
+        self.channel_gain = self._calculate_channel_state()
+        return self._get_state(), {}
+
+    def _large_scale_gain_cached(self):
+        # 服务链路增益已由拓扑在建链时算好
+        return self.topology.serving_gain
+
+    def _calculate_sinr(self, power_alloc, rb_alloc):
+        noise_power = 1e-9  # -90 dBm
+        return self.topology.sinr(power_alloc, noise_power, scale=self._shadowing_factor)
+
+
+class VectorWirelessCommEnv(gym.Env):
+    """
+    N 个相互独立小区的批量版本，所有状态以 (N, num_users) 数组保存，一次 NumPy 调用完成全部小区的 step
+
+    step 返回 (obs, rewards, terminations, truncations, info)，到达 max_steps 的小区在同一步内自动重置，
+    返回的 obs 为新回合的初始状态，截断前的观测在 info['final_obs'] 中。
+    """
 
-        reward = alpha * np.sum(throughput) + beta * jain_index - gamma * total_power
-        return reward
\ No newline at end of file
+    def __init__(self, num_envs=8, num_users=10, num_rb=100, max_steps=None, seed=None):
+        super(VectorWirelessCommEnv, self).__init__()
+        self.num_envs = num_envs
+        self.num_users = num_users
+        self.num_rb = num_rb
+        self.max_steps = max_steps  # 每个小区的截断步数，None 表示与单环境一样持续仿真
+
+        # 单个小区的空间与 WirelessCommEnv 保持一致，批量空间在第0维堆叠
+        self.single_observation_space = spaces.Box(low=0, high=1, shape=(4 * num_users,), dtype=np.float64)
+        self.single_action_space = spaces.Box(low=0, high=1, shape=(2 * num_users,))
+        self.observation_space = spaces.Box(low=0, high=1, shape=(num_envs, 4 * num_users), dtype=np.float64)
+        self.action_space = spaces.Box(low=0, high=1, shape=(num_envs, 2 * num_users))
+
+        # 基站与信道参数 (与 WirelessCommEnv 相同)
+        self.max_power = 20
+        self.bandwidth = 180e3
+        self.path_loss_coeff = 34.5
+        self.shadowing_std = 8
+        self.noise_power = 1e-9
+
+        self.user_positions = np.ones((num_envs, num_users))
+        self.qos_demand = np.zeros((num_envs, num_users), dtype=np.int64)
+        self.elapsed_steps = np.zeros(num_envs, dtype=np.int64)
+
+        # 信道缓存: 大尺度增益按小区在重置时更新，阴影衰落因子每个时隙抽取一次
+        self._large_scale_gain = np.zeros((num_envs, num_users))
+        self._shadowing_factor = np.ones((num_envs, 1))
+        self.channel_gain = np.zeros((num_envs, num_users))
+
+        # 各组件独立的随机数流，批量抽取 (N, num_users) 个样本，结果只取决于 seed 和 num_envs
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        self._rng = make_streams(seed, ('positions', 'qos', 'shadowing'))
+        return [seed]
+
+    def reset(self, seed=None, options=None):
+        super(VectorWirelessCommEnv, self).reset(seed=seed)
+        if seed is not None:
+            self.seed(seed)
+        self._calculate_channel_state()
+        self._reset_envs(np.ones(self.num_envs, dtype=bool))
+        return self._get_state(), {}
+
+    def _reset_envs(self, mask):
+        """只重置 mask 为 True 的小区"""
+        count = int(np.count_nonzero(mask))
+        if count == 0:
+            return
+        positions = self._rng['positions'].uniform(50, 500, (count, self.num_users))
+        self.user_positions[mask] = positions
+        self.qos_demand[mask] = self._rng['qos'].integers(1, 5, (count, self.num_users))
+        self.elapsed_steps[mask] = 0
+
+        pl = self.path_loss_coeff + 20 * np.log10(positions)
+        self._large_scale_gain[mask] = 10 ** (-pl / 20)
+        self.channel_gain[mask] = self._large_scale_gain[mask] * self._shadowing_factor[mask]
+
+    def _get_state(self):
+        csi = self.channel_gain
+        state = np.zeros((self.num_envs, 4 * self.num_users))
+        n = self.num_users
+        state[:, :n] = csi
+        state[:, n:2 * n] = self.qos_demand / 5.0
+        # 负载与干扰特征: WirelessCommEnv 从未记录 last_action，这两段恒为0，这里保持一致
+        return state
+
+    def _calculate_channel_state(self):
+        # 每个小区每个时隙抽取一个阴影衰落值，对应单环境中的标量阴影衰落
+        shadowing = self._rng['shadowing'].normal(0, self.shadowing_std, (self.num_envs, 1))
+        self._shadowing_factor = 10 ** (-shadowing / 20)
+        self.channel_gain = self._large_scale_gain * self._shadowing_factor
+        return self.channel_gain
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        n = self.num_users
+        rb_alloc = actions[:, :n]
+        power_alloc = actions[:, n:] * self.max_power
+
+        # SINR 与吞吐量 (N, num_users)
+        interference = np.sum(power_alloc, axis=1, keepdims=True) - power_alloc
+        sinr = (power_alloc * self.channel_gain) / (interference + self.noise_power)
+        throughput = throughput_mbps(sinr, self.bandwidth)
+
+        rewards = self._calculate_reward(throughput, power_alloc)
+
+        # 自动重置到达截断步数的小区，返回的是新回合的初始状态
+        self.elapsed_steps += 1
+        terminations = np.zeros(self.num_envs, dtype=bool)  # 无终止条件
+        truncations = np.zeros(self.num_envs, dtype=bool)
+        if self.max_steps is not None:
+            truncations = self.elapsed_steps >= self.max_steps
+        self._calculate_channel_state()
+        next_states = self._get_state()
+        final_obs = next_states
+        if np.any(truncations):
+            final_obs = next_states.copy()
+            self._reset_envs(truncations)
+            next_states[truncations] = self._get_state()[truncations]
+
+        return next_states, rewards, terminations, truncations, {'final_obs': final_obs}
+
+    def _calculate_reward(self, throughput, power_alloc):
+        alpha, beta, gamma = 0.7, 0.2, 0.1
+        kpis = reduce_kpis(throughput, power_alloc)  # 每个小区一行
+        return alpha * kpis['sum_throughput'] + beta * kpis['jain'] - gamma * kpis['sum_power']